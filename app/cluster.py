@@ -0,0 +1,376 @@
+"""Запуск бота несколькими процессами: приёмник апдейтов и N воркеров.
+
+Пример:
+    python -m app.cluster --workers 4
+    python -m app.cluster --workers 4 --webhook --url https://example.com --secret your_secret
+
+Приёмник получает апдейты long polling'ом или через вебхук, не разбирая
+их в объекты aiogram: из JSON берётся только id пользователя, и апдейт
+пересылается воркеру user_id % N. Воркер — обычный app.main в режиме
+вебхука на 127.0.0.1 с --worker-id. Все апдейты одного пользователя
+попадают в один процесс в порядке поступления, поэтому его FSM-сессия
+(SQLiteStorage в общем fsm.db) живёт в памяти только одного воркера.
+Анкеты, рекомендации и подписки, изменённые другими воркерами, каждый
+воркер видит через журнал изменений базы (database/changes.py).
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import secrets
+import signal
+import sys
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+from dotenv import load_dotenv
+
+from database.db import close_db, init_db
+
+# Сколько апдейтов одного воркера пересылается одновременно. Апдейты
+# одного пользователя всегда идут по одному каналу и не обгоняют друг друга.
+CHANNELS_PER_WORKER = 8
+# Сколько апдейтов может ждать пересылки, прежде чем приёмник перестанет
+# забирать новые из getUpdates.
+MAX_PENDING = 10_000
+# Сколько секунд ждать, пока воркер начнёт принимать соединения.
+WORKER_START_TIMEOUT = 60.0
+# Сколько секунд ждать штатного завершения воркера перед SIGKILL.
+WORKER_STOP_TIMEOUT = 15.0
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+def update_user_id(update: Dict[str, Any]) -> Optional[int]:
+    """id пользователя (или чата), от которого пришёл апдейт."""
+    for value in update.values():
+        if isinstance(value, dict):
+            user = value.get("from") or value.get("user") or value.get("chat")
+            if isinstance(user, dict) and "id" in user:
+                return user["id"]
+    return None
+
+class ShardRouter:
+    """Пересылка апдейтов воркерам по user_id.
+
+    У каждого воркера CHANNELS_PER_WORKER очередей с одной задачей-отправителем
+    на каждую; апдейт пользователя всегда попадает в одну и ту же очередь.
+    Если воркер недоступен (например, перезапускается), отправка повторяется
+    до успеха, и следующие апдейты этой очереди ждут.
+    """
+
+    def __init__(self, worker_urls: List[str], secret: Optional[str] = None, retry_delay: float = 0.5):
+        self.worker_urls = worker_urls
+        self.secret = secret
+        self.retry_delay = retry_delay
+        self._queues: List[List[asyncio.Queue]] = []
+        self._tasks: List[asyncio.Task] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.routed = [0] * len(worker_urls)
+        self.forwarded = [0] * len(worker_urls)
+        self.retries = 0
+        self.rejected = 0
+
+    async def start(self):
+        headers = {SECRET_HEADER: self.secret} if self.secret else None
+        self._session = aiohttp.ClientSession(headers=headers)
+        for worker, url in enumerate(self.worker_urls):
+            queues = [asyncio.Queue() for _ in range(CHANNELS_PER_WORKER)]
+            self._queues.append(queues)
+            self._tasks += [asyncio.create_task(self._forward(worker, url, q)) for q in queues]
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Останавливает пересылку, сначала до drain_timeout секунд дожидаясь отправки очередей."""
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(
+                asyncio.gather(*(q.join() for queues in self._queues for q in queues)), drain_timeout
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._queues.clear()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def pending(self) -> int:
+        return sum(q.qsize() for queues in self._queues for q in queues)
+
+    def route(self, update: Dict[str, Any]) -> int:
+        """Ставит апдейт в очередь его воркера; возвращает номер воркера."""
+        user_id = update_user_id(update) or 0
+        worker = user_id % len(self.worker_urls)
+        channel = user_id // len(self.worker_urls) % CHANNELS_PER_WORKER
+        self._queues[worker][channel].put_nowait(update)
+        self.routed[worker] += 1
+        return worker
+
+    async def _forward(self, worker: int, url: str, updates: asyncio.Queue):
+        while True:
+            update = await updates.get()
+            try:
+                while True:
+                    try:
+                        async with self._session.post(url, json=update) as response:
+                            if response.status >= 400:
+                                # Воркер отверг апдейт (например, неверный секрет): повтор не поможет.
+                                print(f"Ошибка при пересылке апдейта воркеру {worker}: HTTP {response.status}")
+                                self.rejected += 1
+                            else:
+                                self.forwarded[worker] += 1
+                        break
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        self.retries += 1
+                        await asyncio.sleep(self.retry_delay)
+            finally:
+                updates.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self.pending,
+            "routed": list(self.routed),
+            "forwarded": list(self.forwarded),
+            "retries": self.retries,
+            "rejected": self.rejected,
+        }
+
+class WorkerProcess:
+    """Процесс `python -m app.main --webhook --worker-id N`, перезапускаемый при падении."""
+
+    def __init__(
+        self,
+        index: int,
+        port: int,
+        extra_args: Optional[List[str]] = None,
+        env: Optional[Dict[str, str]] = None,
+        cwd: Optional[str] = None,
+        path: str = "/webhook",
+    ):
+        self.index = index
+        self.port = port
+        self.extra_args = extra_args or []
+        self.env = env
+        self.cwd = cwd
+        self.path = path
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.restarts = 0
+        self._supervisor: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}{self.path}"
+
+    async def _spawn(self):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "app.main", "--webhook",
+            "--host", "127.0.0.1", "--port", str(self.port), "--path", self.path,
+            "--worker-id", str(self.index), *self.extra_args,
+            env=self.env, cwd=self.cwd,
+        )
+
+    async def start(self):
+        await self._spawn()
+        await self.wait_ready()
+        self._supervisor = asyncio.create_task(self._supervise())
+
+    async def wait_ready(self, timeout: float = WORKER_START_TIMEOUT):
+        """Ждёт, пока воркер начнёт принимать соединения на своём порту."""
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            if self.process.returncode is not None:
+                raise RuntimeError(f"воркер {self.index} завершился с кодом {self.process.returncode}")
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", self.port)
+            except OSError:
+                if asyncio.get_running_loop().time() > deadline:
+                    raise RuntimeError(f"воркер {self.index} не запустился за {timeout:.0f} с")
+                await asyncio.sleep(0.1)
+            else:
+                writer.close()
+                return
+
+    async def _supervise(self):
+        while True:
+            code = await self.process.wait()
+            if self._stopping:
+                return
+            self.restarts += 1
+            print(f"Воркер {self.index} завершился с кодом {code}, перезапуск...")
+            await asyncio.sleep(1)
+            try:
+                await self._spawn()
+            except OSError as e:
+                print(f"Ошибка при перезапуске воркера {self.index}: {e}")
+                return
+
+    async def stop(self, timeout: float = WORKER_STOP_TIMEOUT):
+        self._stopping = True
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._supervisor
+        if self.process is None or self.process.returncode is not None:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Воркер {self.index} не завершился за {timeout:.0f} с, SIGKILL")
+            self.process.kill()
+            await self.process.wait()
+
+async def start_workers(workers: List[WorkerProcess]):
+    """Запускает воркеры и ждёт их готовности; при ошибке останавливает уже запущенные."""
+    try:
+        await asyncio.gather(*(worker.start() for worker in workers))
+    except BaseException:
+        await stop_workers(workers)
+        raise
+
+async def stop_workers(workers: List[WorkerProcess]):
+    await asyncio.gather(*(worker.stop() for worker in workers))
+
+async def poll_updates(api_url: str, token: str, router: ShardRouter, timeout: int = 30):
+    """Long polling getUpdates с пересылкой апдейтов воркерам."""
+    url = f"{api_url.rstrip('/')}/bot{token}/getUpdates"
+    offset = 0
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout + 10)) as session:
+        async with session.post(f"{api_url.rstrip('/')}/bot{token}/deleteWebhook") as response:
+            await response.read()
+        while True:
+            while router.pending >= MAX_PENDING:
+                await asyncio.sleep(0.05)
+            try:
+                async with session.post(url, data={"offset": str(offset), "timeout": str(timeout)}) as response:
+                    payload = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                print(f"Ошибка при получении апдейтов: {e}")
+                await asyncio.sleep(1)
+                continue
+            if not payload.get("ok"):
+                print(f"Ошибка при получении апдейтов: {payload.get('description')}")
+                await asyncio.sleep(1)
+                continue
+            for update in payload["result"]:
+                offset = update["update_id"] + 1
+                router.route(update)
+
+async def serve_webhook(args, router: ShardRouter, stop: asyncio.Event):
+    """Вебхук приёмника: проверяет секрет и пересылает апдейт воркеру."""
+
+    async def handle(request: web.Request) -> web.Response:
+        if request.headers.get(SECRET_HEADER) != args.secret:
+            return web.Response(status=401)
+        router.route(await request.json())
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(args.path, handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, args.host, args.port).start()
+        if args.url:
+            form = {"url": args.url.rstrip("/") + args.path, "max_connections": "100", "secret_token": args.secret}
+            async with aiohttp.ClientSession() as session:
+                async with session.post(f"{args.api_url.rstrip('/')}/bot{args.token}/setWebhook", data=form) as response:
+                    payload = await response.json()
+            if not payload.get("ok"):
+                print(f"Ошибка при регистрации вебхука: {payload.get('description')}")
+        print(f"Приёмник вебхука запущен на {args.host}:{args.port}{args.path}...")
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Запуск RTFinder приёмником и несколькими воркерами")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", "2")),
+                        help="сколько процессов-воркеров запустить")
+    parser.add_argument("--worker-port", type=int, default=int(os.getenv("WORKER_PORT", "8100")),
+                        help="порт первого воркера на 127.0.0.1; остальные занимают следующие")
+    parser.add_argument("--webhook", action="store_true",
+                        help="принимать апдейты через вебхук вместо long polling")
+    parser.add_argument("--host", default=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+                        help="адрес HTTP-сервера вебхука приёмника")
+    parser.add_argument("--port", type=int, default=int(os.getenv("WEBHOOK_PORT", "8080")),
+                        help="порт HTTP-сервера вебхука приёмника")
+    parser.add_argument("--path", default=os.getenv("WEBHOOK_PATH", "/webhook"),
+                        help="путь, на который приходят апдейты")
+    parser.add_argument("--url", default=os.getenv("WEBHOOK_URL"),
+                        help="публичный адрес вебхука; без него вебхук в Telegram не регистрируется")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET"),
+                        help="секретный токен вебхука приёмника (обязателен для --webhook)")
+    parser.add_argument("--api-url", default=os.getenv("TELEGRAM_API_URL", "https://api.telegram.org"),
+                        help="адрес сервера Bot API")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("METRICS_PORT", "0")),
+                        help="порт /metrics первого воркера; остальные занимают следующие (по умолчанию 0 — выключено)")
+    parser.add_argument("--global-rate", type=float, default=float(os.getenv("OUTBOUND_GLOBAL_RATE", "30")),
+                        help="общий лимит исходящих запросов бота в секунду; делится между воркерами поровну")
+    args, worker_args = parser.parse_known_args(argv)
+    if args.webhook and not args.secret:
+        parser.error("для --webhook нужен --secret или WEBHOOK_SECRET")
+    # Неизвестные приёмнику аргументы (--max-concurrency, --notify-rate, ...) получают воркеры.
+    args.worker_args = worker_args
+    return args
+
+def worker_arguments(args, index: int) -> List[str]:
+    metrics_port = args.metrics_port + index if args.metrics_port else 0
+    # Лимит Telegram действует на бота целиком, а не на процесс. Лимит на
+    # чат делить не нужно: чат пользователя обслуживает один воркер.
+    extra = [
+        "--metrics-port", str(metrics_port),
+        "--global-rate", str(args.global_rate / args.workers),
+        *args.worker_args,
+    ]
+    if args.api_url != "https://api.telegram.org":
+        extra += ["--api-url", args.api_url]
+    return extra
+
+async def run(args):
+    args.token = os.getenv("BOT_TOKEN")
+    if not args.token:
+        raise ValueError("BOT_TOKEN не найден в переменных окружения")
+    # Схему базы создаёт (и переносит со старых версий) один процесс, до воркеров.
+    await init_db()
+    await close_db()
+
+    # Воркеры принимают апдейты только от приёмника: общий случайный секрет.
+    # Пустой WEBHOOK_URL не даёт воркеру зарегистрировать себя вебхуком в Telegram.
+    internal_secret = secrets.token_hex(16)
+    env = {**os.environ, "WEBHOOK_SECRET": internal_secret, "WEBHOOK_URL": ""}
+    workers = [
+        WorkerProcess(i, args.worker_port + i, worker_arguments(args, i), env)
+        for i in range(args.workers)
+    ]
+    await start_workers(workers)
+    router = ShardRouter([worker.url for worker in workers], internal_secret)
+    await router.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+    print(f"Запущено воркеров: {args.workers}")
+    try:
+        if args.webhook:
+            await serve_webhook(args, router, stop)
+        else:
+            print("Приёмник запущен (long polling)...")
+            polling = asyncio.create_task(poll_updates(args.api_url, args.token, router))
+            await stop.wait()
+            polling.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await polling
+    finally:
+        await router.stop()
+        await stop_workers(workers)
+
+def main(argv=None):
+    load_dotenv()
+    asyncio.run(run(parse_args(argv)))
+
+if __name__ == "__main__":
+    main()
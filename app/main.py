@@ -1,46 +1,225 @@
+import argparse
 import asyncio
+import contextlib
+import logging
+import signal
+from typing import Optional, Tuple
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.types import BotCommand
-from database.db import init_db
-from hd.handlers import router
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from app.metrics import Metrics, MetricsExporter
+from app.notifications import NotificationWorker
+from app.outbound import OutboundScheduler
+from database.db import (
+    init_db,
+    close_db,
+    add_profile_hook,
+    add_query_hook,
+    cards,
+    change_stats,
+    facets,
+    profile_cache,
+    query_cache,
+    seen_profiles,
+    snapshot,
+    start_change_sync,
+)
+from database.fsm_storage import SQLiteStorage
+from hd.handlers import SEARCH_STATE_PREFIXES, router
+from hd.middlewares import ConcurrencyLimitMiddleware, HandlerMetricsMiddleware, UpdateMetricsMiddleware
 from dotenv import load_dotenv
 import os
 
 # Загрузка переменных окружения
 load_dotenv()
 
-async def set_bot_commands(bot: Bot):    
+async def set_bot_commands(bot: Bot):
     """Регистрация команд бота в Telegram."""
     commands = [
         BotCommand(command="/start", description="Начать работу с ботом"),
         BotCommand(command="/profile", description="Просмотреть или отредактировать анкету"),
         BotCommand(command="/search", description="Просмотреть анкеты других пользователей"),
-        BotCommand(command="/find", description="Найти пользователей по навыкам"),
+        BotCommand(command="/find", description="Найти пользователей по навыкам или описанию"),
+        BotCommand(command="/subscribe", description="Уведомления о новых анкетах с вашими навыками"),
+        BotCommand(command="/unsubscribe", description="Отключить уведомления"),
         BotCommand(command="/delete_profile", description="Удалить свою анкету"),
         BotCommand(command="/menu", description="Показать меню команд"),
         BotCommand(command="/help", description="Показать эту справку")
     ]
     await bot.set_my_commands(commands)
 
-async def main():
+def parse_args(argv=None):
+    """Разбор аргументов командной строки; значения по умолчанию берутся из .env."""
+    parser = argparse.ArgumentParser(description="Запуск бота RTFinder")
+    parser.add_argument("--webhook", action="store_true",
+                        help="принимать апдейты через вебхук вместо long polling")
+    parser.add_argument("--host", default=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+                        help="адрес локального HTTP-сервера вебхука")
+    parser.add_argument("--port", type=int, default=int(os.getenv("WEBHOOK_PORT", "8080")),
+                        help="порт локального HTTP-сервера вебхука")
+    parser.add_argument("--path", default=os.getenv("WEBHOOK_PATH", "/webhook"),
+                        help="путь, на который приходят апдейты")
+    parser.add_argument("--url", default=os.getenv("WEBHOOK_URL"),
+                        help="публичный адрес вебхука; без него вебхук в Telegram не регистрируется")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET"),
+                        help="секретный токен, проверяемый в заголовке X-Telegram-Bot-Api-Secret-Token (обязателен для --webhook)")
+    parser.add_argument("--api-url", default=os.getenv("TELEGRAM_API_URL"),
+                        help="адрес своего сервера Bot API (например, bench.fake_api в нагрузочном тесте)")
+    parser.add_argument("--max-concurrency", type=int, default=int(os.getenv("MAX_CONCURRENT_UPDATES", "100")),
+                        help="сколько апдейтов обрабатывается одновременно")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("METRICS_PORT", "0")),
+                        help="порт эндпоинта /metrics на 127.0.0.1 (по умолчанию 0 — эндпоинт выключен)")
+    parser.add_argument("--metrics-log-interval", type=float, default=float(os.getenv("METRICS_LOG_INTERVAL", "60")),
+                        help="как часто писать сводку метрик в лог, в секундах (0 — не писать)")
+    parser.add_argument("--notify-rate", type=float, default=float(os.getenv("NOTIFY_RATE", "10")),
+                        help="сколько уведомлений о новых анкетах отправлять в секунду")
+    parser.add_argument("--global-rate", type=float, default=float(os.getenv("OUTBOUND_GLOBAL_RATE", "30")),
+                        help="общий лимит исходящих запросов бота в секунду")
+    parser.add_argument("--chat-rate", type=float, default=float(os.getenv("OUTBOUND_CHAT_RATE", "1")),
+                        help="лимит исходящих запросов в один чат в секунду")
+    parser.add_argument("--worker-id", type=int, default=None,
+                        help="номер воркера при запуске через app.cluster (включает журнал изменений базы)")
+    parser.add_argument("--search-ttl", type=float, default=float(os.getenv("SEARCH_TTL", "3600")),
+                        help="через сколько секунд простоя забывать состояние поиска")
+    parser.add_argument("--fsm-memory-budget", type=float, default=float(os.getenv("FSM_MEMORY_BUDGET", "64")),
+                        help="сколько мегабайт данных FSM держать в памяти (0 — без ограничения)")
+    args = parser.parse_args(argv)
+    if args.webhook and not args.secret:
+        # Без секрета вебхук принял бы апдейты от кого угодно.
+        parser.error("для --webhook нужен --secret или WEBHOOK_SECRET")
+    return args
+
+async def on_startup(
+    bot: Bot,
+    metrics_exporter: MetricsExporter,
+    notifier: NotificationWorker,
+    worker_id: Optional[int] = None,
+):
+    """Инициализация базы данных и регистрация команд при запуске."""
+    await init_db()
+    if worker_id is not None:
+        # Базу делят несколько процессов: следим за их изменениями.
+        start_change_sync()
+    if not worker_id:
+        await set_bot_commands(bot)
+    await metrics_exporter.start()
+    await notifier.start()
+
+async def on_shutdown(dispatcher: Dispatcher, metrics_exporter: MetricsExporter, notifier: NotificationWorker):
+    await notifier.stop()
+    await metrics_exporter.stop()
+    # Диспетчер сам хранилище не закрывает: дописываем отложенные изменения FSM.
+    await dispatcher.storage.close()
+    await close_db()
+
+def create_bot(token: str, api_url: Optional[str] = None, scheduler: Optional[OutboundScheduler] = None) -> Tuple[Bot, OutboundScheduler]:
+    """Бот с планировщиком исходящих запросов; api_url — свой сервер Bot API вместо api.telegram.org."""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else None
+    bot = Bot(token=token, session=session)
+    scheduler = scheduler or OutboundScheduler()
+    bot.session.middleware(scheduler)
+    return bot, scheduler
+
+def create_dispatcher(
+    max_concurrency: int,
+    metrics_exporter: MetricsExporter,
+    notifier: NotificationWorker,
+    storage: Optional[BaseStorage] = None,
+    worker_id: Optional[int] = None,
+) -> Dispatcher:
+    dp = Dispatcher(
+        storage=storage or SQLiteStorage(),
+        metrics_exporter=metrics_exporter,
+        notifier=notifier,
+        worker_id=worker_id,
+    )
+    metrics = metrics_exporter.metrics
+    # Метрики апдейтов снаружи ограничителя, чтобы учитывать и время ожидания в очереди.
+    dp.update.outer_middleware(UpdateMetricsMiddleware(metrics))
+    dp.update.outer_middleware(ConcurrencyLimitMiddleware(max_concurrency, metrics))
+    router.message.middleware(HandlerMetricsMiddleware(metrics))
+    router.callback_query.middleware(HandlerMetricsMiddleware(metrics))
+    dp.include_router(router)
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return dp
+
+async def run_webhook(bot: Bot, dp: Dispatcher, args):
+    """Запуск бота в режиме вебхука на локальном aiohttp-сервере."""
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=args.secret).register(app, path=args.path)
+    # Хуки startup/shutdown диспетчера вызываются вместе с запуском и остановкой приложения.
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, args.host, args.port).start()
+        if args.url:
+            await bot.set_webhook(
+                args.url.rstrip("/") + args.path,
+                secret_token=args.secret,
+                max_connections=min(args.max_concurrency, 100),
+            )
+        print(f"Бот запущен в режиме вебхука на {args.host}:{args.port}{args.path}...")
+        # SIGTERM (так app.cluster останавливает воркеры) завершает работу
+        # штатно: хуки shutdown дописывают отложенные изменения в базу.
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with contextlib.suppress(NotImplementedError):
+                loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+async def main(argv=None):
     """Запуск бота."""
+    args = parse_args(argv)
     bot_token = os.getenv("BOT_TOKEN")
     if not bot_token:
         raise ValueError("BOT_TOKEN не найден в переменных окружения")
-    bot = Bot(token=bot_token)
-    dp = Dispatcher(storage=MemoryStorage())
-    dp.include_router(router)
+    scheduler = OutboundScheduler(global_rate=args.global_rate, chat_rate=args.chat_rate, chat_burst=args.chat_rate * 5)
+    bot, scheduler = create_bot(bot_token, args.api_url, scheduler)
 
-    # Инициализация базы данных
-    init_db()
+    metrics = Metrics()
+    add_query_hook(metrics.observe_query)
+    metrics.add_collector("profile_cache", profile_cache.stats)
+    metrics.add_collector("query_cache", query_cache.stats)
+    metrics.add_collector("snapshot", snapshot.stats)
+    metrics.add_collector("seen", seen_profiles.stats)
+    metrics.add_collector("facets", facets.stats)
+    metrics.add_collector("cards", cards.stats)
+    metrics.add_collector("outbound", scheduler.stats)
+    # Из воркеров кластера уведомления рассылает только нулевой.
+    notifier = NotificationWorker(bot, rate=args.notify_rate, deliver=not args.worker_id)
+    add_profile_hook(notifier.profile_saved)
+    metrics.add_collector("notifications", notifier.stats)
+    if args.worker_id is not None:
+        metrics.add_collector("changes", change_stats)
+    storage = SQLiteStorage(
+        volatile_prefixes=SEARCH_STATE_PREFIXES,
+        volatile_ttl=args.search_ttl,
+        memory_budget=int(args.fsm_memory_budget * 2 ** 20) or None,
+    )
+    await storage.start()
+    metrics.add_collector("fsm", storage.stats)
+    exporter = MetricsExporter(metrics, port=args.metrics_port, log_interval=args.metrics_log_interval)
+    dp = create_dispatcher(args.max_concurrency, exporter, notifier, storage=storage, worker_id=args.worker_id)
 
-    # Регистрация команд
-    await set_bot_commands(bot)
+    if args.webhook:
+        await run_webhook(bot, dp, args)
+        return
 
     # Запуск бота в режиме polling
     print("Бот запущен...")
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
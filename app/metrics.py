@@ -0,0 +1,189 @@
+import asyncio
+import json
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger("rtfinder.metrics")
+
+# Границы корзин гистограмм задержек, в секундах.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(k)} {v}" for k, v in self.values.items()]
+        return lines
+
+    def snapshot(self) -> Dict[str, float]:
+        return {_format_labels(k) or "total": v for k, v in self.values.items()}
+
+class Gauge(Counter):
+    def set(self, value: float, **labels: str):
+        self.values[_labels(labels)] = value
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        # Для каждого набора меток: счётчики по корзинам (+Inf в конце), сумма, количество.
+        self.series: Dict[Labels, list] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = _labels(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def quantile(self, key: Labels, q: float) -> float:
+        """Оценка квантиля по корзинам (верхняя граница корзины)."""
+        counts, _, total = self.series[key]
+        target, seen = q * total, 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total_sum, total_count) in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total_sum}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {total_count}")
+        return lines
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {
+            _format_labels(key) or "total": {
+                "count": count,
+                "avg_ms": round(total / count * 1000, 3) if count else 0,
+                "p50_ms": self.quantile(key, 0.5) * 1000,
+                "p99_ms": self.quantile(key, 0.99) * 1000,
+            }
+            for key, (_, total, count) in self.series.items()
+        }
+
+class Metrics:
+    """Метрики бота: задержки апдейтов и обработчиков, запросы к базе, кэши."""
+
+    def __init__(self):
+        self.updates_in_flight = Gauge("rtfinder_updates_in_flight", "Updates being processed right now")
+        self.update_duration = Histogram("rtfinder_update_duration_seconds", "Full update processing time")
+        self.update_queue_duration = Histogram("rtfinder_update_queue_seconds", "Time an update waits for a free handler slot")
+        self.handler_duration = Histogram("rtfinder_handler_duration_seconds", "Handler execution time")
+        self.handler_errors = Counter("rtfinder_handler_errors_total", "Handler exceptions")
+        self.db_query_duration = Histogram("rtfinder_db_query_duration_seconds", "Database query time")
+        self.db_rows = Counter("rtfinder_db_rows_total", "Rows read or changed by database queries")
+        self.collected = Gauge("rtfinder_component_stat", "Counters reported by caches and the outbound scheduler")
+        self._metrics = [
+            self.updates_in_flight, self.update_duration, self.update_queue_duration, self.handler_duration,
+            self.handler_errors, self.db_query_duration, self.db_rows, self.collected,
+        ]
+        self._collectors: Dict[str, Callable[[], Dict[str, float]]] = {}
+        self.updates_in_flight.set(0)
+
+    def add_collector(self, component: str, stats: Callable[[], Dict[str, float]]):
+        """Регистрирует функцию stats() компонента, опрашиваемую при выгрузке метрик."""
+        self._collectors[component] = stats
+
+    def observe_query(self, name: str, seconds: float, rows: int):
+        """Хук для database.db.add_query_hook."""
+        self.db_query_duration.observe(seconds, query=name)
+        self.db_rows.inc(rows, query=name)
+
+    def _collect(self):
+        for component, stats in self._collectors.items():
+            for stat, value in stats().items():
+                self.collected.set(value, component=component, stat=stat)
+
+    def render(self) -> str:
+        """Метрики в текстовом формате Prometheus."""
+        self._collect()
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, object]:
+        """Сводка метрик для структурированного лога."""
+        self._collect()
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+class MetricsExporter:
+    """HTTP-эндпоинт /metrics и периодическая запись сводки в лог."""
+
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 0, log_interval: float = 60.0):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.log_interval = log_interval
+        self._runner = None
+        self._log_task = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.metrics.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Prometheus-Format": "0.0.4"})
+
+    async def _log_loop(self):
+        while True:
+            await asyncio.sleep(self.log_interval)
+            logger.info(json.dumps({"ts": time.time(), "metrics": self.metrics.snapshot()}, ensure_ascii=False))
+
+    async def start(self):
+        if self.port:
+            app = web.Application()
+            app.router.add_get("/metrics", self._handle)
+            self._runner = web.AppRunner(app)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        if self.log_interval:
+            self._log_task = asyncio.create_task(self._log_loop())
+
+    async def stop(self):
+        if self._log_task is not None:
+            self._log_task.cancel()
+            self._log_task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,166 @@
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError
+
+from app.outbound import TokenBucket
+from database.db import (
+    find_subscribers,
+    finish_notification_batch,
+    get_new_profile_batch,
+    get_notifications,
+    get_users_by_ids,
+    queue_notifications,
+    set_subscription,
+)
+from database.scoring import mask_to_tags
+
+# Сколько анкет перечислять в одном уведомлении.
+PROFILES_PER_MESSAGE = 5
+
+class NotificationWorker:
+    """Рассылка подписчикам уведомлений о новых анкетах с общими тегами.
+
+    Новая анкета отмечается в таблице new_profiles в той же транзакции,
+    что и сохраняется, а хук add_user только будит фоновую задачу. Задача
+    находит подписчиков по масочному индексу, записывает уведомления в
+    таблицу notifications и отправляет их пачками: уведомления одному
+    получателю объединяются в одно сообщение. Рассылка идёт со своим
+    лимитом rate сообщений в секунду, чтобы оставлять запас ответам
+    обработчиков в общем лимите бота.
+
+    При нескольких процессах бота над одной базой уведомления ставит в
+    очередь и рассылает только один (deliver=True), иначе получатели
+    получали бы дубли.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        rate: float = 10.0,
+        batch_size: int = 200,
+        max_attempts: int = 3,
+        poll_interval: float = 30.0,
+        deliver: bool = True,
+    ):
+        self.bot = bot
+        self.bucket = TokenBucket(rate, rate)
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.deliver = deliver
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def profile_saved(self, user_id: int, old_mask: Optional[int], new_mask: int):
+        """Хук add_user: новая анкета с тегами уже отмечена в базе, будим рассылку."""
+        if old_mask is None and new_mask:
+            self._wake.set()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            # Сбрасываем до чтения таблиц: анкета, сохранённая во время
+            # рассылки, разбудит следующее ожидание.
+            self._wake.clear()
+            try:
+                if self.deliver:
+                    fanned_out = await self._fan_out()
+                    if await self._deliver() or fanned_out:
+                        continue
+            except Exception as e:
+                print(f"Ошибка при рассылке уведомлений: {e}")
+            # Очередь пуста: ждём новых анкет, изредка перечитывая таблицу
+            # (там могут остаться уведомления для повторной попытки).
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fan_out(self) -> int:
+        """Ставит уведомления об одной пачке новых анкет; возвращает число анкет."""
+        rows = await get_new_profile_batch(self.batch_size)
+        if not rows:
+            return 0
+        recipients = {row["profile_id"]: find_subscribers(row["profile_id"], row["tag_mask"]) for row in rows}
+        if not await queue_notifications(recipients):
+            return 0
+        self.queued += sum(map(len, recipients.values()))
+        return len(rows)
+
+    async def _deliver(self) -> int:
+        """Отправляет одну пачку уведомлений; возвращает число удалённых из очереди."""
+        rows = await get_notifications(self.batch_size)
+        if not rows:
+            return 0
+        by_recipient: "OrderedDict[int, List]" = OrderedDict()
+        for row in rows:
+            by_recipient.setdefault(row["recipient_id"], []).append(row)
+        results = await asyncio.gather(*(
+            self._send(recipient, recipient_rows) for recipient, recipient_rows in by_recipient.items()
+        ))
+        done, retry = [], []
+        for recipient_rows, delivered in zip(by_recipient.values(), results):
+            for row in recipient_rows:
+                if delivered or row["attempts"] + 1 >= self.max_attempts:
+                    done.append(row["id"])
+                    self.dropped += not delivered
+                else:
+                    retry.append(row["id"])
+        await finish_notification_batch(done, retry)
+        return len(done)
+
+    async def _send(self, recipient: int, rows) -> bool:
+        """Одно сообщение получателю обо всех его анкетах из пачки; True, если строки можно удалить."""
+        profiles = await get_users_by_ids(dict.fromkeys(row["profile_id"] for row in rows))
+        if not profiles:
+            # Анкеты успели удалить — сообщать не о чем.
+            return True
+        lines = ["🔔 Новые анкеты с вашими навыками:"]
+        for profile in profiles[:PROFILES_PER_MESSAGE]:
+            lines.append(f"👤 @{profile.username}, {profile.course} — {', '.join(mask_to_tags(profile.tag_mask))}")
+        if len(profiles) > PROFILES_PER_MESSAGE:
+            lines.append(f"…и ещё {len(profiles) - PROFILES_PER_MESSAGE}. Смотрите /search")
+        lines.append("Отключить уведомления: /unsubscribe")
+        await self.bucket.acquire()
+        try:
+            await self.bot.send_message(recipient, "\n".join(lines))
+        except TelegramForbiddenError:
+            # Пользователь заблокировал бота: подписка больше не нужна.
+            await set_subscription(recipient, False)
+            self.failed += 1
+            return True
+        except TelegramAPIError as e:
+            print(f"Ошибка при отправке уведомления: {e}")
+            self.failed += 1
+            return False
+        self.sent += 1
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики поставленных в очередь, отправленных и отброшенных уведомлений."""
+        return {
+            "queued": self.queued,
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
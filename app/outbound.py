@@ -0,0 +1,192 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    EditMessageCaption,
+    EditMessageMedia,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    TelegramMethod,
+)
+from aiogram.methods.base import TelegramType
+
+# Правки одного типа одного сообщения: если несколько таких правок ждут
+# отправки, уходит только последняя.
+COALESCED_METHODS = (EditMessageText, EditMessageCaption, EditMessageReplyMarkup, EditMessageMedia)
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity за раз.
+
+    Ожидающие получают токены строго по очереди, поэтому сообщения в один
+    чат уходят в том порядке, в котором их отправили обработчики.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        """Ждёт и забирает один токен."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.blocked_until - now
+                if wait <= 0 and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep(max(wait, (1 - self.tokens) / self.rate))
+
+    def refund(self):
+        """Возвращает неиспользованный токен."""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def block(self, seconds: float):
+        """Запрещает выдачу токенов на seconds секунд (ответ RetryAfter)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class _PendingEdit:
+    __slots__ = ("future", "superseded")
+
+    def __init__(self):
+        self.future = asyncio.get_running_loop().create_future()
+        self.superseded = None
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Планировщик исходящих запросов к Bot API.
+
+    Запросы, адресованные чату, проходят через общее ведро токенов и ведро
+    своего чата, поэтому бот не упирается в лимиты Telegram. На RetryAfter
+    планировщик приостанавливает отправку и повторяет запрос сам. Правки
+    сообщения, которые успели устареть, пока ждали токена, не отправляются:
+    их вызывающие получают результат более новой правки того же сообщения.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 5.0,
+        max_retries: int = 3,
+        max_chats: int = 10000,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chat_buckets: "OrderedDict[Any, TokenBucket]" = OrderedDict()
+        self._pending_edits: Dict[Any, _PendingEdit] = {}
+        self.sent = 0
+        self.retried = 0
+        self.coalesced = 0
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            while len(self._chat_buckets) > self.max_chats:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    @staticmethod
+    def _edit_key(method: TelegramMethod) -> Optional[tuple]:
+        if not isinstance(method, COALESCED_METHODS):
+            return None
+        return (
+            type(method),
+            getattr(method, "chat_id", None),
+            getattr(method, "message_id", None),
+            getattr(method, "inline_message_id", None),
+        )
+
+    async def _send(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot, method, chat_bucket):
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retried += 1
+                # Флуд-лимит может быть как на чат, так и на бота целиком.
+                (chat_bucket or self.global_bucket).block(e.retry_after)
+                await asyncio.sleep(e.retry_after)
+                await self._acquire(chat_bucket)
+            else:
+                self.sent += 1
+                return result
+
+    async def _acquire(self, chat_bucket: Optional[TokenBucket]):
+        # Сначала токен своего чата, чтобы не занимать общий токен в ожидании.
+        if chat_bucket is not None:
+            await chat_bucket.acquire()
+        await self.global_bucket.acquire()
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ):
+        chat_id = getattr(method, "chat_id", None)
+        chat_bucket = self._chat_bucket(chat_id) if chat_id is not None else None
+        key = self._edit_key(method)
+        if key is None:
+            if chat_bucket is None:
+                return await make_request(bot, method)
+            await self._acquire(chat_bucket)
+            return await self._send(make_request, bot, method, chat_bucket)
+
+        entry = _PendingEdit()
+        previous = self._pending_edits.get(key)
+        if previous is not None:
+            previous.superseded = entry
+        self._pending_edits[key] = entry
+        try:
+            await self._acquire(chat_bucket)
+            if entry.superseded is not None:
+                # Пока ждали токена, пришла более новая правка: отдаём токены ей.
+                self.coalesced += 1
+                if chat_bucket is not None:
+                    chat_bucket.refund()
+                self.global_bucket.refund()
+                result = await asyncio.shield(entry.superseded.future)
+            else:
+                result = await self._send(make_request, bot, method, chat_bucket)
+        except BaseException as e:
+            if not entry.future.done():
+                if isinstance(e, Exception):
+                    entry.future.set_exception(e)
+                    entry.future.exception()  # ошибку получает вызывающий, а не ожидающие
+                else:
+                    entry.future.cancel()
+            raise
+        finally:
+            if self._pending_edits.get(key) is entry:
+                del self._pending_edits[key]
+        entry.future.set_result(result)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики отправленных, повторённых и объединённых запросов."""
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "coalesced": self.coalesced,
+            "pending_edits": len(self._pending_edits),
+        }
@@ -0,0 +1,227 @@
+"""Массовый импорт и экспорт анкет в CSV или JSONL.
+
+Примеры:
+    python -m app.profiles import roster.csv
+    python -m app.profiles export dump.jsonl
+    python -m app.profiles import - --format jsonl < dump.jsonl
+
+Файлы читаются и пишутся потоково: импорт пишет анкеты пакетами по
+--batch-size строк (одна транзакция на пакет), экспорт обходит таблицу
+страницами по user_id. Память не зависит от размера файла. Работающий бот
+подхватывает импортированные анкеты после перезапуска.
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import json
+import os
+import sys
+import time
+from typing import ContextManager, Iterator, List, Optional, TextIO, Tuple
+
+from database import db
+from database.db import ConnectionPool, user_row
+from database.recommendations import clear_recommendations
+from keyboards.keyboards import TAGS
+
+FIELDS = ["user_id", "username", "course", "photo_id", "skills", "tags"]
+BATCH_SIZE = 20_000
+SKILLS_LIMIT = 500
+
+class RowError(ValueError):
+    """Строка файла не прошла проверку."""
+
+def _open(path: str, mode: str) -> ContextManager[TextIO]:
+    if path == "-":
+        return contextlib.nullcontext(sys.stdin if mode == "r" else sys.stdout)
+    # utf-8-sig пропускает BOM, который добавляет Excel при сохранении CSV.
+    encoding = "utf-8-sig" if mode == "r" else "utf-8"
+    return open(path, mode, encoding=encoding, newline="")
+
+def _detect_format(path: str, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    if path.lower().endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    if path.lower().endswith(".csv"):
+        return "csv"
+    raise SystemExit("Не удалось определить формат по имени файла, укажите --format")
+
+def _read_records(f: TextIO, fmt: str) -> Iterator[Tuple[int, dict]]:
+    """Пары (номер строки, запись) из файла."""
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_num, RowError(f"некорректный JSON: {e}")
+                continue
+            yield line_num, record
+
+def _text(record: dict, field: str) -> Optional[str]:
+    value = record.get(field)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def validate(record) -> Tuple:
+    """Кортеж user_row из записи файла; RowError, если запись некорректна."""
+    if isinstance(record, RowError):
+        raise record
+    if not isinstance(record, dict):
+        raise RowError("ожидался объект с полями анкеты")
+    try:
+        user_id = int(record.get("user_id"))
+    except (TypeError, ValueError):
+        raise RowError(f"некорректный user_id: {record.get('user_id')!r}")
+    username = _text(record, "username")
+    course = _text(record, "course")
+    if not username:
+        raise RowError("не указан username")
+    if not course:
+        raise RowError("не указан course")
+    tags = record.get("tags")
+    if tags is None:
+        tags = []
+    elif isinstance(tags, str):
+        tags = tags.split(",")
+    elif not isinstance(tags, list) or not all(isinstance(t, str) for t in tags):
+        raise RowError(f"некорректные теги: {tags!r}")
+    tags = sorted({t.strip() for t in tags if t.strip()})
+    unknown = [t for t in tags if t not in TAGS]
+    if unknown:
+        raise RowError(f"неизвестные теги: {', '.join(unknown)}")
+    skills = _text(record, "skills")
+    return user_row(
+        user_id,
+        username.lstrip("@"),
+        course,
+        _text(record, "photo_id"),
+        skills[:SKILLS_LIMIT] if skills else None,
+        ",".join(tags) or None,
+    )
+
+def _write_batch(conn, rows):
+    with conn:
+        db._write_users(conn, rows)
+
+async def import_profiles(path: str, fmt: str, db_path: str, batch_size: int, dry_run: bool = False) -> int:
+    """Импорт анкет из файла; возвращает число ошибочных строк."""
+    # Для проверки файла база не нужна: при dry_run она не открывается вовсе.
+    pool = None if dry_run else ConnectionPool(db_path, size=1)
+    if pool is not None:
+        await pool.run(db._init_schema)
+    imported = errors = 0
+    started = time.perf_counter()
+    pending: Optional[asyncio.Future] = None
+    batch: List[Tuple] = []
+    try:
+        with _open(path, "r") as f:
+            for line_num, record in _read_records(f, _detect_format(path, fmt)):
+                try:
+                    batch.append(validate(record))
+                except RowError as e:
+                    errors += 1
+                    print(f"Строка {line_num}: {e}", file=sys.stderr)
+                    continue
+                if len(batch) >= batch_size:
+                    # Пока пишется пакет, следующий читается и проверяется.
+                    if pending is not None:
+                        await pending
+                    if pool is not None:
+                        pending = asyncio.ensure_future(pool.run(_write_batch, batch))
+                    imported += len(batch)
+                    batch = []
+            if pending is not None:
+                await pending
+            if batch and pool is not None:
+                await pool.run(_write_batch, batch)
+            imported += len(batch)
+        if imported and pool is not None:
+            # Сохранённые списки рекомендаций и счётчики по тегам не знают
+            # об импортированных анкетах.
+            await pool.run(clear_recommendations)
+            await pool.run(db.rebuild_facets)
+    finally:
+        if pending is not None and not pending.done():
+            # Чтение файла прервалось, пока пишется пакет: дописываем его до закрытия пула.
+            try:
+                await pending
+            except Exception as e:
+                print(f"Ошибка при записи пакета анкет: {e}", file=sys.stderr)
+        if pool is not None:
+            await asyncio.get_running_loop().run_in_executor(None, pool.close)
+    elapsed = time.perf_counter() - started
+    action = "Проверено" if dry_run else "Импортировано"
+    print(
+        f"{action} анкет: {imported}, ошибок: {errors}, {elapsed:.1f} с "
+        f"({imported / elapsed if elapsed else 0:.0f} строк/с)",
+        file=sys.stderr,
+    )
+    return errors
+
+def _export_record(row, fmt: str) -> dict:
+    record = {field: row[field] for field in FIELDS}
+    if fmt == "jsonl":
+        record["tags"] = sorted(db._split_tags(row["tags"]))
+    return record
+
+async def export_profiles(path: str, fmt: str, db_path: str, batch_size: int) -> int:
+    """Экспорт всех анкет в файл; возвращает число записанных анкет."""
+    fmt = _detect_format(path, fmt)
+    if not os.path.exists(db_path):
+        raise SystemExit(f"Файл базы {db_path} не найден")
+    pool = ConnectionPool(db_path, size=1)
+    exported, after = 0, -sys.maxsize - 1
+    try:
+        with _open(path, "w") as f:
+            writer = None
+            if fmt == "csv":
+                writer = csv.DictWriter(f, fieldnames=FIELDS)
+                writer.writeheader()
+            while True:
+                rows = await pool.run(db._get_users_after, after, batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    record = _export_record(row, fmt)
+                    if writer is not None:
+                        writer.writerow(record)
+                    else:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                exported += len(rows)
+                after = rows[-1]["user_id"]
+    finally:
+        await asyncio.get_running_loop().run_in_executor(None, pool.close)
+    print(f"Экспортировано анкет: {exported}", file=sys.stderr)
+    return exported
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Импорт и экспорт анкет RTFinder")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("path", help="файл CSV или JSONL; '-' — stdin/stdout")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="формат файла (по умолчанию по расширению)")
+    parser.add_argument("--db", default=db.DB_PATH, help="файл базы данных")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="сколько анкет записывать одной транзакцией")
+    parser.add_argument("--dry-run", action="store_true", help="только проверить файл, ничего не записывая")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.command == "import":
+        errors = asyncio.run(import_profiles(args.path, args.format, args.db, args.batch_size, args.dry_run))
+        return 1 if errors else 0
+    asyncio.run(export_profiles(args.path, args.format, args.db, args.batch_size))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
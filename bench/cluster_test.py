@@ -0,0 +1,165 @@
+"""Проверка масштабирования app.cluster по числу воркеров.
+
+Пример:
+    python -m bench.cluster_test --workers 1 2 4 --students 1000 --concurrency 200 --size 10000
+
+Поднимается bench.fake_api, и для каждого числа воркеров запускаются
+процессы app.main --worker-id над общей базой, как в app.cluster.
+Апдейты виртуальных студентов из bench.load_test идут не через
+getUpdates, а прямо в ShardRouter приёмника, который пересылает их
+воркерам по user_id; ответы воркеров ловит фейковый Bot API. Для каждого
+числа воркеров выводится пропускная способность и сквозные задержки.
+Прирост возможен, только если ядер процессора больше, чем воркеров:
+приёмник со студентами и фейковым API занимает ещё один процесс.
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import secrets
+import sys
+import tempfile
+from typing import Any, Dict
+
+from app.cluster import ShardRouter, WorkerProcess, start_workers, stop_workers
+from app.metrics import Metrics
+from bench.fake_api import BOT_USER, FakeBotAPI
+from bench.handlers_bench import build_database
+from bench.load_test import STUDENT_ID_BASE, run_level
+from database import db
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class RoutedUpdates:
+    """Источник апдейтов для студентов: апдейты уходят в ShardRouter, ответы ловит фейковый API."""
+
+    def __init__(self, api: FakeBotAPI, router: ShardRouter):
+        self.api = api
+        self.router = router
+        self._update_ids = itertools.count(1)
+
+    def push(self, update: Dict[str, Any]) -> int:
+        update_id = next(self._update_ids)
+        update["update_id"] = update_id
+        self.router.route(update)
+        return update_id
+
+    def __getattr__(self, name):
+        return getattr(self.api, name)
+
+async def run_workers(api: FakeBotAPI, workdir: str, count: int, first_id: int, args) -> Dict[str, Any]:
+    secret = secrets.token_hex(16)
+    env = {
+        **os.environ,
+        "BOT_TOKEN": f"{BOT_USER['id']}:CLUSTER",
+        "WEBHOOK_SECRET": secret,
+        "WEBHOOK_URL": "",
+        "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.getenv("PYTHONPATH")])),
+    }
+    worker_args = [
+        "--api-url", api.url,
+        "--metrics-port", "0",
+        "--metrics-log-interval", "0",
+        "--max-concurrency", str(args.max_concurrency),
+        "--global-rate", str(args.global_rate / count),
+        "--chat-rate", str(args.chat_rate),
+    ]
+    # Базы data.db и fsm.db воркеры открывают в рабочем каталоге.
+    workers = [WorkerProcess(i, args.worker_port + i, worker_args, env, workdir) for i in range(count)]
+    await start_workers(workers)
+    router = ShardRouter([worker.url for worker in workers], secret)
+    await router.start()
+    try:
+        result = await run_level(RoutedUpdates(api, router), Metrics(), args.students, args.concurrency, first_id, args)
+    finally:
+        await router.stop()
+        await stop_workers(workers)
+    # Очередь диспетчера и ошибки обработчиков считаются в воркерах, здесь их нет.
+    result.pop("dispatcher_queue")
+    result.pop("handler_errors")
+    result.pop("delivery")
+    result["workers"] = count
+    result["routed"] = router.routed
+    result["restarts"] = sum(worker.restarts for worker in workers)
+    return result
+
+async def run(args) -> Dict[str, Any]:
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rtfinder-cluster-")
+    build_seconds = await build_database(os.path.join(workdir, db.DB_PATH), args.size, args.seed)
+    await db.close_db()
+    print(f"База из {args.size} анкет создана за {build_seconds:.1f} с", file=sys.stderr)
+
+    api = FakeBotAPI(port=args.port)
+    await api.start()
+    levels = []
+    try:
+        for n, count in enumerate(args.workers):
+            result = await run_workers(api, workdir, count, STUDENT_ID_BASE + n * 10 ** 7, args)
+            levels.append(result)
+            e2e = result["end_to_end"]
+            print(
+                f"[{count} воркер.] {result['updates_per_s']} апд/с, e2e p50={e2e.get('p50_ms')} мс "
+                f"p99={e2e.get('p99_ms')} мс, ошибок {result['error_rate']:.2%}",
+                file=sys.stderr,
+            )
+    finally:
+        await api.stop()
+        if not args.keep:
+            for name in os.listdir(workdir):
+                if name.startswith((db.DB_PATH, "fsm.db")):
+                    os.remove(os.path.join(workdir, name))
+            if not args.workdir:
+                os.rmdir(workdir)
+    return {
+        "meta": {
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "size": args.size,
+            "students": args.students,
+            "concurrency": args.concurrency,
+            "cpus": os.cpu_count(),
+            "outbound_calls": dict(api.calls),
+            "unknown_methods": dict(api.unknown_methods),
+        },
+        "levels": levels,
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Масштабирование RTFinder по числу воркеров с фейковым Bot API")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="сколько воркеров запускать (можно несколько вариантов)")
+    parser.add_argument("--students", type=int, default=1000, help="сколько студентов на каждый вариант")
+    parser.add_argument("--concurrency", type=int, default=200, help="сколько студентов проходят сценарий одновременно")
+    parser.add_argument("--size", type=int, default=10_000, help="сколько анкет в базе до начала теста")
+    parser.add_argument("--pages", type=int, default=5, help="сколько анкет пролистать после /search")
+    parser.add_argument("--think", type=float, default=0.0,
+                        help="средняя пауза студента между шагами, в секундах")
+    parser.add_argument("--timeout", type=float, default=60.0, help="сколько ждать ответа на шаг")
+    parser.add_argument("--max-concurrency", type=int, default=100,
+                        help="лимит одновременно обрабатываемых апдейтов в каждом воркере")
+    parser.add_argument("--global-rate", type=float, default=10_000.0,
+                        help="общий лимит исходящих запросов бота в секунду, делится между воркерами")
+    parser.add_argument("--chat-rate", type=float, default=1_000.0,
+                        help="лимит исходящих запросов в один чат в секунду")
+    parser.add_argument("--port", type=int, default=0, help="порт фейкового Bot API (0 — любой свободный)")
+    parser.add_argument("--worker-port", type=int, default=8100, help="порт первого воркера")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="каталог для баз (по умолчанию временный)")
+    parser.add_argument("--keep", action="store_true", help="не удалять базы после теста")
+    parser.add_argument("--out", help="куда сохранить результаты в JSON")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 1 if any(level["error_rate"] for level in report["levels"]) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""Локальный сервер, изображающий Telegram Bot API для нагрузочных тестов.
+
+Бот направляется на него через --api-url (см. app/main.py) или
+TelegramAPIServer.from_base(url). Сервер отдаёт боту апдейты через
+getUpdates и записывает все вызовы методов; ответы на отправку и правку
+сообщений строятся из присланных полей, поэтому aiogram получает
+корректные объекты Message.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from aiohttp import web
+
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "RTFinder", "username": "rtfinder_bot"}
+
+# Методы, отвечающие сообщением в чат.
+SEND_METHODS = {"sendmessage", "sendphoto"}
+EDIT_METHODS = {"editmessagetext", "editmessagecaption", "editmessagereplymarkup", "editmessagemedia"}
+
+def _json_field(value: Optional[str]) -> Any:
+    if value is None:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+class ChatLog:
+    """Последнее сообщение бота в чате и ожидающие ответа бота."""
+
+    __slots__ = ("last_message", "waiters")
+
+    def __init__(self):
+        self.last_message: Optional[Dict[str, Any]] = None
+        self.waiters: Deque[asyncio.Future] = deque()
+
+class FakeBotAPI:
+    """Фейковый Bot API: очередь апдейтов для getUpdates и журнал вызовов."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self._updates: Deque[Dict[str, Any]] = deque()
+        self._new_updates = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._chats: Dict[int, ChatLog] = defaultdict(ChatLog)
+        # update_id -> время, когда апдейт впервые отдан боту.
+        self.delivered_at: Dict[int, float] = {}
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.unknown_methods: Dict[str, int] = defaultdict(int)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Порт 0 означает любой свободный: узнаём, какой достался.
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    # --------------------- АПДЕЙТЫ ---------------------
+    def push(self, update: Dict[str, Any]) -> int:
+        """Ставит апдейт в очередь getUpdates; возвращает его update_id."""
+        update_id = next(self._update_ids)
+        update["update_id"] = update_id
+        self._updates.append(update)
+        self._new_updates.set()
+        return update_id
+
+    def wait_reply(self, chat_id: int) -> asyncio.Future:
+        """Future, который получит первый следующий вызов бота в чате chat_id."""
+        future = asyncio.get_running_loop().create_future()
+        self._chats[chat_id].waiters.append(future)
+        return future
+
+    def last_message(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        return self._chats[chat_id].last_message
+
+    def next_message_id(self) -> int:
+        return next(self._message_ids)
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        # Апдейты до offset бот подтвердил, их больше не отдаём.
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        batch = list(itertools.islice(self._updates, limit))
+        now = time.perf_counter()
+        for update in batch:
+            self.delivered_at.setdefault(update["update_id"], now)
+        return batch
+
+    # --------------------- МЕТОДЫ ---------------------
+    def _message(self, params: Dict[str, Any], message_id: Optional[int] = None) -> Dict[str, Any]:
+        chat_id = int(params["chat_id"])
+        message = {
+            "message_id": message_id or self.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        previous = self._chats[chat_id].last_message or {}
+        if "photo" in params:
+            message["photo"] = [{"file_id": params["photo"], "file_unique_id": "p", "width": 640, "height": 640}]
+        elif "photo" in previous and message_id is not None:
+            message["photo"] = previous["photo"]
+        if "text" in params:
+            message["text"] = params["text"]
+        elif "caption" in params:
+            message["caption"] = params["caption"]
+        elif message_id is not None:
+            for key in ("text", "caption"):
+                if key in previous:
+                    message[key] = previous[key]
+        if "reply_markup" in params:
+            message["reply_markup"] = params["reply_markup"]
+        return message
+
+    def _chat_reply(self, method: str, params: Dict[str, Any]) -> Any:
+        chat_id = int(params["chat_id"])
+        message_id = int(params["message_id"]) if method in EDIT_METHODS else None
+        message = self._message(params, message_id)
+        log = self._chats[chat_id]
+        log.last_message = message
+        while log.waiters:
+            waiter = log.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result((method, message))
+                break
+        return message
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = {key: _json_field(value) if key == "reply_markup" else value
+                  for key, value in (await request.post()).items()}
+        self.calls[method] += 1
+        if method == "getupdates":
+            result: Any = await self._get_updates(params)
+        elif method == "getme":
+            result = BOT_USER
+        elif method in SEND_METHODS or (method in EDIT_METHODS and "chat_id" in params):
+            result = self._chat_reply(method, params)
+        elif method in ("answercallbackquery", "setmycommands", "deletewebhook", "setwebhook", "deletemessage"):
+            result = True
+        else:
+            self.unknown_methods[method] += 1
+            return web.json_response(
+                {"ok": False, "error_code": 400, "description": f"Bad Request: method {method} is not faked"},
+                status=400,
+            )
+        return web.json_response({"ok": True, "result": result})
@@ -0,0 +1,336 @@
+"""Бенчмарк обработчиков hd/handlers.py на синтетической базе анкет.
+
+Пример:
+    python -m bench.handlers_bench --sizes 10000 100000 --out bench_results.json
+    python -m bench.handlers_bench --sizes 10000 --compare bench_results.json
+
+Для каждого размера базы генерируется файл SQLite, после чего роутер
+прогоняется через Dispatcher.feed_update фейковыми апдейтами с ботом, который
+не ходит в сеть. Результаты (p50/p99, пропускная способность, пик памяти)
+сохраняются в JSON и могут сравниваться с прошлым прогоном.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from bench.population import generate_users, user_id_at
+from database import db
+from database.scoring import np
+from hd.handlers import FindUsers, router
+from keyboards.keyboards import TAGS
+
+BATCH_SIZE = 50_000
+BOT_ID = 42
+
+class FakeSession(BaseSession):
+    """Сессия бота без сети: на любой запрос сразу отвечает готовым объектом."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self._message = Message(
+            message_id=1,
+            date=datetime.datetime.now(),
+            chat=Chat(id=1, type="private"),
+            text="ok",
+        )
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        returning = getattr(method, "__returning__", None)
+        if returning is Message or Message in getattr(returning, "__args__", ()):
+            return self._message
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+def _write_batch(conn, rows):
+    with conn:
+        db._write_users(conn, rows)
+
+async def build_database(path: str, size: int, seed: int) -> float:
+    """Создает базу из size синтетических анкет; возвращает время в секундах."""
+    if os.path.exists(path):
+        os.remove(path)
+    started = time.perf_counter()
+    await db.init_db(path)
+    batch = []
+    for user in generate_users(size, seed):
+        batch.append(db.user_row(*user))
+        if len(batch) >= BATCH_SIZE:
+            await db._pool.run(_write_batch, batch)
+            batch = []
+    if batch:
+        await db._pool.run(_write_batch, batch)
+    await db._pool.run(db.rebuild_facets)
+    # Повторная инициализация загружает маски новых анкет в индекс.
+    await db.init_db(path)
+    return time.perf_counter() - started
+
+def _user(user_id: int) -> User:
+    return User(id=user_id, is_bot=False, first_name="Bench", username=f"student{user_id}")
+
+def message_update(update_id: int, user_id: int, text: str) -> Update:
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id,
+        date=datetime.datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=_user(user_id),
+        text=text,
+    ))
+
+def callback_update(update_id: int, user_id: int, data: str) -> Update:
+    return Update(update_id=update_id, callback_query=CallbackQuery(
+        id=str(update_id),
+        from_user=_user(user_id),
+        chat_instance="bench",
+        data=data,
+        message=Message(
+            message_id=update_id,
+            date=datetime.datetime.now(),
+            chat=Chat(id=user_id, type="private"),
+            from_user=_user(BOT_ID),
+            text="bench",
+        ),
+    ))
+
+Prepare = Callable[[], Awaitable[None]]
+
+class Scenarios:
+    """Генераторы пар (подготовка состояния, апдейт) для каждого обработчика."""
+
+    def __init__(self, dp: Dispatcher, bot: Bot, size: int, rng: random.Random):
+        self.dp = dp
+        self.bot = bot
+        self.size = size
+        self.rng = rng
+        self.update_id = 0
+
+    def _next_id(self) -> int:
+        self.update_id += 1
+        return self.update_id
+
+    def _random_user(self) -> int:
+        return user_id_at(self.rng.randrange(self.size))
+
+    def _context(self, user_id: int):
+        return self.dp.fsm.get_context(self.bot, chat_id=user_id, user_id=user_id)
+
+    def _random_tags(self, low: int, high: int) -> List[str]:
+        return self.rng.sample(TAGS, self.rng.randint(low, high))
+
+    async def _noop(self):
+        pass
+
+    def search_command(self) -> Tuple[Prepare, Update]:
+        return self._noop, message_update(self._next_id(), self._random_user(), "/search")
+
+    def find_confirm(self) -> Tuple[Prepare, Update]:
+        user_id = self._random_user()
+        tags = self._random_tags(1, 3)
+
+        async def prepare():
+            context = self._context(user_id)
+            await context.set_state(FindUsers.awaiting_tags)
+            await context.update_data(selected_tags=tags)
+        return prepare, callback_update(self._next_id(), user_id, "find_confirm")
+
+    def show_user_profile(self) -> Tuple[Prepare, Update]:
+        user_id = self._random_user()
+        index = self.rng.randrange(50)
+
+        async def prepare():
+            # Поиск запускается вне замера, измеряется переход на следующую анкету.
+            await self.dp.feed_update(self.bot, message_update(self._next_id(), user_id, "/search"))
+        return prepare, callback_update(self._next_id(), user_id, f"nav_next_{index}")
+
+    def handle_tag_selection(self) -> Tuple[Prepare, Update]:
+        user_id = self._random_user()
+        tags = self._random_tags(0, 4)
+
+        async def prepare():
+            context = self._context(user_id)
+            await context.set_state(FindUsers.awaiting_tags)
+            await context.update_data(selected_tags=tags)
+        return prepare, callback_update(self._next_id(), user_id, f"tag_{self.rng.choice(TAGS)}")
+
+HANDLERS = ["search_command", "find_confirm", "show_user_profile", "handle_tag_selection"]
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def clear_caches():
+    db.profile_cache.clear()
+    db.query_cache.clear()
+
+async def measure(
+    dp: Dispatcher,
+    bot: Bot,
+    make_case: Callable[[], Tuple[Prepare, Update]],
+    iterations: int,
+    warmup: int,
+    memory_iterations: int,
+    cold: bool,
+) -> Dict[str, Any]:
+    session: FakeSession = bot.session
+    for _ in range(warmup):
+        prepare, update = make_case()
+        await prepare()
+        await dp.feed_update(bot, update)
+
+    latencies = []
+    api_calls = 0
+    for _ in range(iterations):
+        prepare, update = make_case()
+        await prepare()
+        if cold:
+            clear_caches()
+        calls_start = session.calls
+        started = time.perf_counter()
+        await dp.feed_update(bot, update)
+        latencies.append(time.perf_counter() - started)
+        api_calls += session.calls - calls_start
+
+    # Пик памяти меряется отдельным коротким прогоном: tracemalloc замедляет
+    # обработчики. Трассировка перезапускается на каждый апдейт, поэтому
+    # учитываются только выделения внутри обработки.
+    peak = 0
+    for _ in range(memory_iterations):
+        prepare, update = make_case()
+        await prepare()
+        if cold:
+            clear_caches()
+        tracemalloc.start()
+        try:
+            await dp.feed_update(bot, update)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "iterations": iterations,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+        "mean_ms": round(total / len(latencies) * 1000, 4),
+        "throughput_per_s": round(len(latencies) / total, 1) if total else None,
+        "peak_mem_kib": round(peak / 1024, 1),
+        "api_calls_per_op": round(api_calls / iterations, 2),
+    }
+
+async def run(args) -> Dict[str, Any]:
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.include_router(router)
+    bot = Bot(f"{BOT_ID}:BENCH", session=FakeSession())
+    results = []
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rtfinder-bench-")
+    try:
+        for size in args.sizes:
+            path = os.path.join(workdir, f"bench_{size}.db")
+            build_seconds = await build_database(path, size, args.seed)
+            print(f"[{size}] база создана за {build_seconds:.1f} с", file=sys.stderr)
+            for handler in args.handlers:
+                scenarios = Scenarios(dp, bot, size, random.Random(args.seed))
+                stats = await measure(
+                    dp, bot, getattr(scenarios, handler),
+                    args.iterations, args.warmup, args.memory_iterations, args.cold,
+                )
+                results.append({"size": size, "handler": handler, **stats})
+                print(
+                    f"[{size}] {handler}: p50={stats['p50_ms']} мс p99={stats['p99_ms']} мс "
+                    f"{stats['throughput_per_s']} оп/с пик {stats['peak_mem_kib']} КиБ",
+                    file=sys.stderr,
+                )
+            await db.close_db()
+            if not args.keep:
+                os.remove(path)
+    finally:
+        await db.close_db()
+        await bot.session.close()
+    return {
+        "meta": {
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": getattr(np, "__version__", None),
+            "seed": args.seed,
+            "iterations": args.iterations,
+            "cold": args.cold,
+        },
+        "results": results,
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Строки о регрессиях: p50 или p99 выросли больше чем в threshold раз."""
+    previous = {(r["size"], r["handler"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get((result["size"], result["handler"]))
+        if old is None:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            if old[metric] and result[metric] > old[metric] * threshold:
+                regressions.append(
+                    f"{result['handler']} @ {result['size']}: {metric} "
+                    f"{old[metric]} -> {result[metric]} (x{result[metric] / old[metric]:.2f})"
+                )
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк обработчиков RTFinder")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000],
+                        help="размеры базы анкет")
+    parser.add_argument("--handlers", nargs="+", choices=HANDLERS, default=HANDLERS)
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--memory-iterations", type=int, default=20,
+                        help="сколько апдейтов прогонять под tracemalloc")
+    parser.add_argument("--cold", action="store_true",
+                        help="сбрасывать кэши анкет и выдачи перед каждым апдейтом")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="каталог для файлов баз (по умолчанию временный)")
+    parser.add_argument("--keep", action="store_true", help="не удалять сгенерированные базы")
+    parser.add_argument("--out", help="куда сохранить результаты в JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона для поиска регрессий")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="во сколько раз должна вырасти задержка, чтобы считаться регрессией")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"Регрессия: {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
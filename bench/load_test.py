@@ -0,0 +1,275 @@
+"""Нагрузочный тест полного сценария бота с фейковым Bot API.
+
+Пример:
+    python -m bench.load_test --students 2000 --concurrency 100 500 --size 10000
+
+Поднимается bench.fake_api, бот из app/main.py (тот же диспетчер,
+middleware и планировщик исходящих запросов) опрашивает его через
+getUpdates, а виртуальные студенты проходят сценарий
+/start → курс → фото или /skip → описание → теги → подтверждение →
+/search → листание анкет. Каждый шаг ждёт первого ответа бота в чате
+студента. Для каждого уровня одновременности считаются сквозные задержки
+по шагам, задержка доставки апдейта боту, время ожидания в очереди
+диспетчера (ConcurrencyLimitMiddleware) и доля ошибок.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app.main import create_bot, create_dispatcher
+from app.metrics import Metrics, MetricsExporter
+from app.notifications import NotificationWorker
+from app.outbound import OutboundScheduler
+from bench.fake_api import BOT_USER, FakeBotAPI
+from bench.handlers_bench import build_database, percentile
+from database import db
+from database.fsm_storage import SQLiteStorage
+from keyboards.keyboards import TAGS
+
+COURSES = ["course_1", "course_2", "course_3", "course_4", "course_master", "course_phd"]
+# user_id виртуальных студентов не пересекаются с анкетами bench.population.
+STUDENT_ID_BASE = 10 ** 12
+
+class StepTimeout(Exception):
+    """Бот не ответил на шаг сценария вовремя."""
+
+class Student:
+    """Виртуальный студент: шлёт апдейты и ждёт ответа бота на каждый."""
+
+    def __init__(self, api: FakeBotAPI, user_id: int, rng: random.Random, stats: "LevelStats", args):
+        self.api = api
+        self.user_id = user_id
+        self.rng = rng
+        self.stats = stats
+        self.timeout = args.timeout
+        self.think = args.think
+        self.pages = args.pages
+        self.user = {"id": user_id, "is_bot": False, "first_name": "Student", "username": f"student{user_id}"}
+
+    def _message(self, **fields) -> Dict[str, Any]:
+        return {
+            "message_id": self.api.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": self.user_id, "type": "private"},
+            "from": self.user,
+            **fields,
+        }
+
+    def _callback(self, data: str) -> Dict[str, Any]:
+        message = self.api.last_message(self.user_id) or {
+            "message_id": 0, "date": int(time.time()), "chat": {"id": self.user_id, "type": "private"}, "text": "",
+        }
+        return {
+            "id": str(self.api.next_message_id()),
+            "from": self.user,
+            "chat_instance": str(self.user_id),
+            "data": data,
+            "message": message,
+        }
+
+    async def _step(self, name: str, update: Dict[str, Any]) -> Dict[str, Any]:
+        if self.think:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.think))
+        reply = self.api.wait_reply(self.user_id)
+        started = time.perf_counter()
+        update_id = self.api.push(update)
+        try:
+            _, message = await asyncio.wait_for(reply, self.timeout)
+        except asyncio.TimeoutError:
+            self.stats.errors[name] += 1
+            raise StepTimeout(name)
+        finished = time.perf_counter()
+        self.stats.latencies[name].append(finished - started)
+        delivered = self.api.delivered_at.pop(update_id, None)
+        if delivered is not None:
+            self.stats.delivery.append(delivered - started)
+        return message
+
+    async def send_text(self, name: str, text: str):
+        return await self._step(name, {"message": self._message(text=text)})
+
+    async def press(self, name: str, data: str):
+        return await self._step(name, {"callback_query": self._callback(data)})
+
+    async def run(self):
+        await self.send_text("start", "/start")
+        await self.press("handle_course", self.rng.choice(COURSES))
+        if self.rng.random() < 0.5:
+            photo = [{"file_id": f"photo{self.user_id}", "file_unique_id": "p", "width": 640, "height": 640}]
+            await self._step("handle_photo", {"message": self._message(photo=photo)})
+        else:
+            await self.send_text("skip_photo", "/skip")
+        await self.send_text("handle_skills", "Ищу команду для хакатона, пишу бэкенд")
+        for tag in self.rng.sample(TAGS, self.rng.randint(1, 3)):
+            await self.press("handle_tag_selection", f"tag_{tag}")
+        await self.press("confirm_tags", "tags_confirm")
+        await self.press("confirm_profile", "confirm_profile")
+        message = await self.send_text("search_command", "/search")
+        for _ in range(self.pages):
+            buttons = [b for row in (message.get("reply_markup") or {}).get("inline_keyboard", []) for b in row]
+            nav_next = next((b["callback_data"] for b in buttons if b.get("callback_data", "").startswith("nav_next_")), None)
+            if nav_next is None:
+                break
+            message = await self.press("navigate_profiles", nav_next)
+
+class LevelStats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.delivery: List[float] = []
+        self.failed_students = 0
+
+def _summary(values: List[float]) -> Dict[str, Any]:
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+    }
+
+async def run_level(api: FakeBotAPI, metrics: Metrics, students: int, concurrency: int, first_id: int, args) -> Dict[str, Any]:
+    """Прогоняет students студентов, не больше concurrency одновременно."""
+    stats = LevelStats()
+    metrics.update_queue_duration.series.clear()
+    metrics.handler_errors.values.clear()
+    rng = random.Random(args.seed + concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            student = Student(api, first_id + i, random.Random(rng.random()), stats, args)
+            try:
+                await student.run()
+            except StepTimeout:
+                stats.failed_students += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(students)))
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [v for values in stats.latencies.values() for v in values]
+    updates = len(all_latencies) + sum(stats.errors.values())
+    queue = metrics.update_queue_duration.snapshot().get("total", {})
+    return {
+        "concurrency": concurrency,
+        "students": students,
+        "updates": updates,
+        "seconds": round(elapsed, 2),
+        "updates_per_s": round(updates / elapsed, 1) if elapsed else None,
+        "error_rate": round(sum(stats.errors.values()) / updates, 4) if updates else 0,
+        "failed_students": stats.failed_students,
+        "handler_errors": int(sum(metrics.handler_errors.values.values())),
+        "end_to_end": _summary(all_latencies),
+        "delivery": _summary(stats.delivery),
+        "dispatcher_queue": queue,
+        "steps": {name: {**_summary(values), "errors": stats.errors.get(name, 0)}
+                  for name, values in stats.latencies.items()},
+    }
+
+async def run(args) -> Dict[str, Any]:
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rtfinder-load-")
+    db_path = os.path.join(workdir, "load.db")
+    build_seconds = await build_database(db_path, args.size, args.seed)
+    print(f"База из {args.size} анкет создана за {build_seconds:.1f} с", file=sys.stderr)
+
+    api = FakeBotAPI(port=args.port)
+    await api.start()
+    scheduler = OutboundScheduler(global_rate=args.global_rate, chat_rate=args.chat_rate, chat_burst=args.chat_rate * 5)
+    bot, scheduler = create_bot(f"{BOT_USER['id']}:LOAD", api.url, scheduler)
+    metrics = Metrics()
+    db.add_query_hook(metrics.observe_query)
+    exporter = MetricsExporter(metrics, port=0, log_interval=0)
+    notifier = NotificationWorker(bot)
+    db.add_profile_hook(notifier.profile_saved)
+    storage = SQLiteStorage(os.path.join(workdir, "fsm.db")) if args.fsm == "sqlite" else MemoryStorage()
+    dp = create_dispatcher(args.max_concurrency, exporter, notifier, storage=storage)
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+
+    levels = []
+    try:
+        for n, concurrency in enumerate(args.concurrency):
+            result = await run_level(api, metrics, args.students, concurrency, STUDENT_ID_BASE + n * 10 ** 7, args)
+            levels.append(result)
+            e2e = result["end_to_end"]
+            print(
+                f"[{concurrency}] {result['updates_per_s']} апд/с, e2e p50={e2e.get('p50_ms')} мс "
+                f"p99={e2e.get('p99_ms')} мс, очередь p99≤{result['dispatcher_queue'].get('p99_ms')} мс, "
+                f"ошибок {result['error_rate']:.2%}",
+                file=sys.stderr,
+            )
+    finally:
+        await dp.stop_polling()
+        await polling
+        await api.stop()
+        await storage.close()
+        if not args.keep:
+            for name in os.listdir(workdir):
+                if name.startswith(("load.db", "fsm.db")):
+                    os.remove(os.path.join(workdir, name))
+            if not args.workdir:
+                os.rmdir(workdir)
+    return {
+        "meta": {
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "size": args.size,
+            "students": args.students,
+            "max_concurrency": args.max_concurrency,
+            "think_s": args.think,
+            "fsm": args.fsm,
+            "outbound_calls": dict(api.calls),
+            "unknown_methods": dict(api.unknown_methods),
+            "outbound": scheduler.stats(),
+        },
+        "levels": levels,
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест RTFinder с фейковым Bot API")
+    parser.add_argument("--students", type=int, default=1000, help="сколько студентов на каждом уровне")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200],
+                        help="сколько студентов проходят сценарий одновременно (можно несколько уровней)")
+    parser.add_argument("--size", type=int, default=10_000, help="сколько анкет в базе до начала теста")
+    parser.add_argument("--pages", type=int, default=5, help="сколько анкет пролистать после /search")
+    parser.add_argument("--think", type=float, default=0.0,
+                        help="средняя пауза студента между шагами, в секундах")
+    parser.add_argument("--timeout", type=float, default=30.0, help="сколько ждать ответа на шаг")
+    parser.add_argument("--max-concurrency", type=int, default=100,
+                        help="лимит одновременно обрабатываемых апдейтов в боте")
+    parser.add_argument("--global-rate", type=float, default=10_000.0,
+                        help="общий лимит исходящих запросов бота в секунду (в Telegram — 30)")
+    parser.add_argument("--chat-rate", type=float, default=1_000.0,
+                        help="лимит исходящих запросов в один чат в секунду (в Telegram — 1)")
+    parser.add_argument("--fsm", choices=["sqlite", "memory"], default="sqlite", help="хранилище FSM бота")
+    parser.add_argument("--port", type=int, default=0, help="порт фейкового Bot API (0 — любой свободный)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="каталог для баз (по умолчанию временный)")
+    parser.add_argument("--keep", action="store_true", help="не удалять базы после теста")
+    parser.add_argument("--out", help="куда сохранить результаты в JSON")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 1 if any(level["error_rate"] for level in report["levels"]) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
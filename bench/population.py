@@ -0,0 +1,64 @@
+"""Генерация синтетических анкет с реалистичным распределением тегов."""
+import random
+from typing import Iterator, Tuple
+
+from keyboards.keyboards import TAGS
+
+# Типичные роли студентов: набор «своих» тегов и доля роли в выборке.
+ARCHETYPES = [
+    (0.25, ["backend", "python", "java", "c#", "devops", "cloud", "data"]),
+    (0.20, ["frontend", "js", "web", "ux/ui"]),
+    (0.15, ["ml", "data", "python", "cloud"]),
+    (0.10, ["android", "ios", "java", "ux/ui"]),
+    (0.08, ["gamedev", "c++", "c#"]),
+    (0.10, ["ux/ui", "web", "management"]),
+    (0.05, ["security", "devops", "c++", "python"]),
+    (0.07, ["management", "data", "web"]),
+]
+# Сколько тегов отмечает студент: 0 — анкета без навыков.
+TAG_COUNT_WEIGHTS = [(0, 0.05), (1, 0.15), (2, 0.30), (3, 0.25), (4, 0.15), (5, 0.10)]
+COURSES = [("1 курс", 0.3), ("2 курс", 0.25), ("3 курс", 0.2), ("4 курс", 0.15), ("Магистратура", 0.08), ("Аспирантура", 0.02)]
+DESCRIPTIONS = [
+    "Ищу команду для хакатона",
+    "Хочу сделать пет-проект, нужен дизайнер",
+    "Ищу бэкендера в стартап",
+    "Готов помочь с фронтендом, ищу проект",
+    "Собираю команду на проектный практикум",
+    "Ищу ментора и единомышленников",
+]
+# Вероятность взять тег вне своей роли.
+NOISE = 0.15
+PHOTO_SHARE = 0.4
+FIRST_USER_ID = 100_000_000
+
+def _weighted(rng: random.Random, pairs):
+    values, weights = zip(*pairs)
+    return rng.choices(values, weights)[0]
+
+def generate_tags(rng: random.Random) -> str:
+    """Строка тегов одной анкеты."""
+    _, own = rng.choices(ARCHETYPES, [w for w, _ in ARCHETYPES])[0]
+    count = _weighted(rng, TAG_COUNT_WEIGHTS)
+    tags = set()
+    while len(tags) < count:
+        tags.add(rng.choice(TAGS) if rng.random() < NOISE else rng.choice(own))
+    return ",".join(sorted(tags))
+
+def generate_users(count: int, seed: int = 0) -> Iterator[Tuple]:
+    """Анкеты (user_id, username, course, photo_id, skills, tags) в порядке user_id."""
+    rng = random.Random(seed)
+    for i in range(count):
+        user_id = FIRST_USER_ID + i
+        photo_id = f"photo_{user_id}" if rng.random() < PHOTO_SHARE else None
+        yield (
+            user_id,
+            f"student{user_id}",
+            _weighted(rng, COURSES),
+            photo_id,
+            rng.choice(DESCRIPTIONS),
+            generate_tags(rng),
+        )
+
+def user_id_at(index: int) -> int:
+    """user_id анкеты с порядковым номером index в сгенерированной выборке."""
+    return FIRST_USER_ID + index
@@ -0,0 +1,173 @@
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+# Маркер отсутствия записи в кэше: None — допустимое значение (анкеты нет).
+MISSING = object()
+
+class ProfileCache:
+    """Ограниченный LRU-кэш анкет со сроком жизни записей.
+
+    Записи вытесняются по давности использования при превышении maxsize и
+    считаются устаревшими через ttl секунд. Запись, прочитанная из базы до
+    вызова invalidate, в кэш не попадает: для этого put принимает токен,
+    полученный через begin() перед запросом к базе.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any:
+        """Значение по ключу или MISSING."""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.evictions += 1
+            self.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def begin(self) -> int:
+        """Токен для последующего put; устаревает после любой инвалидации."""
+        return self._generation
+
+    def put(self, key: Hashable, value: Any, token: int):
+        if token != self._generation:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        """Удаляет запись после изменения анкеты."""
+        self._generation += 1
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._generation += 1
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики попаданий, промахов и вытеснений."""
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+class _Ranking:
+    __slots__ = ("epoch", "ids", "total", "complete")
+
+    def __init__(self, epoch: int):
+        self.epoch = epoch
+        self.ids = array("q")
+        self.total = None
+        self.complete = False
+
+class QueryCache:
+    """Кэш ранжирования по набору тегов, привязанный к эпохе данных.
+
+    Ранжирование хранится один раз на пару (маска тегов, режим) без
+    исключения пользователя; анкета самого ищущего убирается при чтении.
+    Префикс выдачи достраивается по мере листания, удваиваясь, а любая
+    запись в индекс (смена scorer.epoch) делает все записи устаревшими.
+    """
+
+    def __init__(self, scorer, maxsize: int = 256, chunk: int = 64):
+        self.scorer = scorer
+        self.maxsize = maxsize
+        self.chunk = chunk
+        self._data: "OrderedDict[Tuple[int, bool], _Ranking]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _entry(self, query_mask: int, only_matching: bool) -> _Ranking:
+        key = (query_mask, only_matching)
+        entry = self._data.get(key)
+        if entry is not None and entry.epoch == self.scorer.epoch:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = _Ranking(self.scorer.epoch)
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def _includes(self, user_id: Optional[int], query_mask: int, only_matching: bool) -> bool:
+        if user_id is None:
+            return False
+        mask = self.scorer.mask_of(user_id)
+        return mask is not None and (not only_matching or bool(mask & query_mask))
+
+    def window(
+        self,
+        query_mask: int,
+        offset: int,
+        limit: int,
+        exclude_user_id: Optional[int] = None,
+        only_matching: bool = True,
+    ) -> List[int]:
+        """user_id на позициях [offset, offset + limit) выдачи без exclude_user_id."""
+        entry = self._entry(query_mask, only_matching)
+        # Одна лишняя позиция на случай, если исключаемая анкета попадёт в префикс.
+        needed = offset + limit + 1
+        if len(entry.ids) < needed and not entry.complete:
+            k = max(needed, 2 * len(entry.ids), self.chunk)
+            ranked = self.scorer.top_k(query_mask, k, None, only_matching)
+            entry.ids = array("q", (user_id for user_id, _ in ranked))
+            entry.complete = len(ranked) < k
+        prefix = entry.ids[:needed]
+        if exclude_user_id is not None and exclude_user_id in prefix:
+            prefix.remove(exclude_user_id)
+        return prefix[offset:offset + limit].tolist()
+
+    def count(
+        self,
+        query_mask: int,
+        exclude_user_id: Optional[int] = None,
+        only_matching: bool = True,
+    ) -> int:
+        """Число анкет в выдаче без exclude_user_id."""
+        entry = self._entry(query_mask, only_matching)
+        if entry.total is None:
+            entry.total = len(entry.ids) if entry.complete else self.scorer.count(query_mask, None, only_matching)
+        return entry.total - self._includes(exclude_user_id, query_mask, only_matching)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики попаданий, промахов и вытеснений."""
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Set, Union
+
+from database.models import Profile
+from database.scoring import mask_to_tags
+
+MATCHED_LINE_CACHE_SIZE = 4096
+
+def format_tags(tags: Union[Set[str], List[str], None]) -> str:
+    if not tags:
+        return "Не указаны"
+    return ", ".join(sorted(tags))
+
+@lru_cache(maxsize=MATCHED_LINE_CACHE_SIZE)
+def _matched_line(mask: int) -> str:
+    return f"✨ Совпавшие навыки: {format_tags(mask_to_tags(mask))}\n"
+
+class ProfileCard:
+    """Готовый текст анкеты.
+
+    Строится один раз при сохранении анкеты; при показе меняется только
+    строка совпавших со зрителем навыков. source — анкета, по которой
+    построен текст: по ней видно, что анкета с тех пор изменилась.
+    """
+
+    __slots__ = ("source", "mask", "head", "tail")
+
+    def __init__(self, profile: Profile):
+        self.source = profile.to_state()
+        self.mask = profile.tag_mask
+        self.head = (
+            f"👤 @{profile.username}\n"
+            f"📚 Курс: {profile.course}\n"
+            f"🛠 Навыки: {format_tags(profile.tags)}\n"
+        )
+        self.tail = f"📝 Описание: {profile.skills or 'Не указано'}\n"
+
+    def text(self, query_mask: int = 0) -> str:
+        """Текст для зрителя, искавшего по маске query_mask."""
+        matched = query_mask & self.mask
+        if not matched:
+            return self.head + self.tail
+        return self.head + _matched_line(matched) + self.tail
+
+    def own_text(self) -> str:
+        """Текст для владельца анкеты."""
+        return "📌 Ваша анкета:\n" + self.head + self.tail
+
+class CardCache:
+    """LRU-кэш карточек анкет по user_id."""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._cards: "OrderedDict[int, ProfileCard]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._cards)
+
+    def put(self, profile: Profile) -> ProfileCard:
+        """Строит карточку сохранённой анкеты."""
+        card = ProfileCard(profile)
+        self._cards[profile.user_id] = card
+        self._cards.move_to_end(profile.user_id)
+        while len(self._cards) > self.maxsize:
+            self._cards.popitem(last=False)
+        return card
+
+    def get(self, profile: Profile) -> ProfileCard:
+        """Карточка анкеты; устаревшая (анкета с тех пор изменилась) строится заново."""
+        card = self._cards.get(profile.user_id)
+        if card is not None and card.source == profile.to_state():
+            self._cards.move_to_end(profile.user_id)
+            self.hits += 1
+            return card
+        self.misses += 1
+        return self.put(profile)
+
+    def invalidate(self, user_id: int):
+        self._cards.pop(user_id, None)
+
+    def clear(self):
+        self._cards.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._cards), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,57 @@
+import sqlite3
+import time
+from typing import Iterable, List, Tuple
+
+# Что изменилось: user_id в журнале — анкета, владелец списка
+# рекомендаций или подписчик соответственно.
+CHANGE_PROFILE = 1
+CHANGE_RECOMMENDATIONS = 2
+CHANGE_SUBSCRIPTION = 3
+
+# Журнал изменений для нескольких процессов бота над одной базой: каждая
+# запись анкеты, списка рекомендаций или подписки добавляет строку в той же
+# транзакции, а процессы дочитывают журнал и обновляют свои индексы в памяти.
+SQL_CREATE_CHANGES = '''
+    CREATE TABLE IF NOT EXISTS changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        created_at REAL NOT NULL
+    )
+'''
+SQL_INSERT_CHANGE = "INSERT INTO changes (kind, user_id, created_at) VALUES (?, ?, ?)"
+SQL_GET_CHANGES_AFTER = "SELECT seq, kind, user_id FROM changes WHERE seq > ? ORDER BY seq LIMIT ?"
+SQL_GET_CHANGE_RANGE = "SELECT COALESCE(MIN(seq), 0) AS oldest, COALESCE(MAX(seq), 0) AS latest FROM changes"
+SQL_TRIM_CHANGES = "DELETE FROM changes WHERE created_at < ?"
+
+# Журнал ведётся, только если его кто-то читает (см. db.start_change_sync):
+# одиночному процессу он не нужен.
+_enabled = False
+
+def enable_change_log():
+    global _enabled
+    _enabled = True
+
+def init_changes(conn: sqlite3.Connection):
+    conn.execute(SQL_CREATE_CHANGES)
+    conn.commit()
+
+def log_changes(conn: sqlite3.Connection, kind: int, user_ids: Iterable[int]):
+    """Добавляет изменения в журнал; транзакцией управляет вызывающий."""
+    if _enabled:
+        now = time.time()
+        conn.executemany(SQL_INSERT_CHANGE, [(kind, user_id, now) for user_id in user_ids])
+
+def get_change_range(conn: sqlite3.Connection) -> Tuple[int, int]:
+    """Номера самой старой и самой новой записей журнала (0, если он пуст)."""
+    row = conn.execute(SQL_GET_CHANGE_RANGE).fetchone()
+    return row["oldest"], row["latest"]
+
+def get_changes(conn: sqlite3.Connection, after: int, limit: int) -> Tuple[int, List[sqlite3.Row]]:
+    """Самая старая запись журнала и до limit записей с номером больше after."""
+    oldest, _ = get_change_range(conn)
+    return oldest, conn.execute(SQL_GET_CHANGES_AFTER, (after, limit)).fetchall()
+
+def trim_changes(conn: sqlite3.Connection, before: float):
+    with conn:
+        conn.execute(SQL_TRIM_CHANGES, (before,))
@@ -1,16 +1,246 @@
-﻿import sqlite3
+﻿import asyncio
+import queue
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from sqlite3 import Error
 
-def create_connection():
-    """Создает подключение к базе данных SQLite с доступом к полям по именам."""
-    conn = None
-    try:
-        conn = sqlite3.connect("data.db")
+from database.cache import MISSING, ProfileCache, QueryCache
+from database.cards import CardCache, ProfileCard
+from database.changes import (
+    CHANGE_PROFILE,
+    CHANGE_RECOMMENDATIONS,
+    CHANGE_SUBSCRIPTION,
+    enable_change_log,
+    get_change_range,
+    get_changes,
+    init_changes,
+    log_changes,
+    trim_changes,
+)
+from database.facets import FacetCounts, get_facets, init_facets, rebuild_facets, write_facet_changes
+from database.models import Profile
+from database.notifications import (
+    enqueue_notifications,
+    finish_notifications,
+    get_new_profiles,
+    get_pending_notifications,
+    get_subscribed,
+    get_subscribers,
+    init_notifications,
+    put_subscription,
+    record_new_profiles,
+)
+from database.recommendations import (
+    RECOMMENDATIONS_CAP,
+    Recommendations,
+    apply_profile_change,
+    get_many_recommendation_bars,
+    get_recommendation_bars,
+    get_recommendations,
+    init_recommendations,
+    put_many_recommendations,
+    put_recommendations,
+)
+from database.scoring import overlap, scorer, tags_to_mask
+from database.seen import SeenProfiles, SeenStore, init_seen
+from database.snapshot import ProfileSnapshot, SnapshotStore
+from database.writes import WriteQueue
+
+DB_PATH = "data.db"
+POOL_SIZE = 4
+PROFILE_CACHE_SIZE = 10000
+PROFILE_CACHE_TTL = 300
+CARD_CACHE_SIZE = 10000
+QUERY_CACHE_SIZE = 256
+TEXT_CACHE_SIZE = 64
+# Для скольких пользователей фильтры просмотренных анкет держатся в памяти.
+SEEN_CACHE_SIZE = 2000
+# Не дольше скольких секунд запись ждёт пересборки снимка анкет.
+SNAPSHOT_STALENESS = 1.0
+# Сколько лучших совпадений поиска по описанию можно пролистать.
+TEXT_SEARCH_LIMIT = 1000
+# Групповая запись анкет: сколько секунд пакет под нагрузкой ждёт
+# попутчиков и сколько изменений пишется одной транзакцией.
+WRITE_BATCH_DELAY = 0.005
+WRITE_BATCH_SIZE = 500
+# Несколько процессов над одной базой (app/cluster.py): как часто
+# дочитывать журнал изменений, сколько записей за раз и сколько секунд
+# хранить записи журнала.
+CHANGE_SYNC_INTERVAL = 0.2
+CHANGE_SYNC_BATCH = 500
+CHANGE_LOG_TTL = 600
+
+# SQL-запросы вынесены в константы: sqlite3 кэширует скомпилированные
+# выражения на каждом подключении по тексту запроса, поэтому одни и те же
+# строки переиспользуют подготовленные statement'ы между вызовами.
+SQL_CREATE_USERS = '''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT NOT NULL,
+        course TEXT NOT NULL,
+        photo_id TEXT,
+        skills TEXT,
+        tags TEXT,
+        tag_mask INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+SQL_UPSERT_USER = '''
+    INSERT OR REPLACE INTO users (user_id, username, course, photo_id, skills, tags, tag_mask)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+SQL_GET_USER = "SELECT * FROM users WHERE user_id = ?"
+SQL_DELETE_USER = "DELETE FROM users WHERE user_id = ?"
+SQL_GET_USERS_BY_IDS = "SELECT * FROM users WHERE user_id IN ({placeholders})"
+SQL_GET_TAG_MASKS = "SELECT user_id, tag_mask FROM users"
+SQL_GET_SNAPSHOT_ROWS = "SELECT user_id, username, course, photo_id, skills, tag_mask FROM users ORDER BY user_id"
+# Постраничный обход по первичному ключу: каждая страница — поиск по индексу,
+# без OFFSET и без чтения всей таблицы в память.
+SQL_GET_USERS_AFTER = "SELECT * FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?"
+
+# Полнотекстовый индекс по описаниям анкет; rowid совпадает с user_id.
+SQL_CREATE_USERS_FTS = "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(skills, tokenize = 'unicode61 remove_diacritics 2')"
+SQL_INSERT_USER_FTS = "INSERT INTO users_fts (rowid, skills) VALUES (?, ?)"
+SQL_DELETE_USER_FTS = "DELETE FROM users_fts WHERE rowid = ?"
+# Совпадения по описанию в порядке bm25; при ненулевой маске — только
+# анкеты хотя бы с одним общим тегом.
+SQL_SEARCH_TEXT = '''
+    SELECT users_fts.rowid AS user_id FROM users_fts
+    JOIN users AS u ON u.user_id = users_fts.rowid
+    WHERE users_fts MATCH ? AND (? = 0 OR u.tag_mask & ? != 0)
+    ORDER BY users_fts.rank, users_fts.rowid
+    LIMIT ?
+'''
+
+# Функции hook(name, seconds, rows), вызываемые после каждого запроса пула:
+# name — имя функции запроса, rows — число прочитанных или изменённых строк.
+query_hooks = []
+
+def add_query_hook(hook):
+    """Подписка на тайминги запросов к базе (например, для метрик)."""
+    query_hooks.append(hook)
+
+# Функции hook(user_id, old_mask, new_mask), вызываемые после сохранения
+# анкеты в add_user; old_mask равен None для новой анкеты. Хуки не должны
+# блокировать: они выполняются в обработчике, сохраняющем анкету.
+profile_hooks = []
+
+def add_profile_hook(hook):
+    """Подписка на сохранение анкет (например, для уведомлений)."""
+    profile_hooks.append(hook)
+
+class ConnectionPool:
+    """Пул долгоживущих подключений к SQLite, работающий в отдельных потоках.
+
+    Каждый запрос выполняется в пуле потоков, поэтому цикл событий aiogram
+    не блокируется на дисковом вводе-выводе.
+    """
+
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        self.path = path
+        self._size = size
+        self._idle: "queue.SimpleQueue[sqlite3.Connection]" = queue.SimpleQueue()
+        self._connections = []
+        self._executor = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._executor is not None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
         conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
         return conn
-    except Error as e:
-        print(f"Ошибка подключения к базе данных: {e}")
-    return conn
+
+    def open(self):
+        """Открывает подключения и пул потоков, если они ещё не созданы."""
+        if self.is_open:
+            return
+        for _ in range(self._size):
+            conn = self._connect()
+            self._connections.append(conn)
+            self._idle.put(conn)
+        # Потоков столько же, сколько подключений: свободное подключение есть всегда.
+        self._executor = ThreadPoolExecutor(max_workers=self._size, thread_name_prefix="db")
+
+    def _call(self, func, args):
+        conn = self._idle.get()
+        try:
+            changes = conn.total_changes
+            started = time.perf_counter()
+            result = func(conn, *args)
+            elapsed = time.perf_counter() - started
+            if isinstance(result, list):
+                rows = len(result)
+            elif isinstance(result, sqlite3.Row):
+                rows = 1
+            else:
+                rows = conn.total_changes - changes
+            return result, elapsed, rows
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    async def run(self, func, *args):
+        """Выполняет func(conn, *args) на свободном подключении из пула."""
+        if not self.is_open:
+            self.open()
+        loop = asyncio.get_running_loop()
+        result, elapsed, rows = await loop.run_in_executor(self._executor, self._call, func, args)
+        if query_hooks:
+            name = func.__name__.lstrip("_")
+            for hook in query_hooks:
+                hook(name, elapsed, rows)
+        return result
+
+    def close(self):
+        """Закрывает все подключения пула."""
+        if not self.is_open:
+            return
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        for conn in self._connections:
+            conn.close()
+        self._connections.clear()
+        self._idle = queue.SimpleQueue()
+
+_pool = ConnectionPool(DB_PATH)
+profile_cache = ProfileCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+# Колоночная копия users для чтения анкет без обращения к диску; пока
+# снимок не загружен, анкеты читаются через profile_cache.
+snapshot = SnapshotStore(SNAPSHOT_STALENESS)
+# Ранжирования по наборам тегов; сбрасываются через эпоху scorer при add_user/delete_user.
+query_cache = QueryCache(scorer, QUERY_CACHE_SIZE)
+# Выдачи поиска по описанию: (запрос FTS5, маска) -> (эпоха scorer, user_id по bm25).
+_text_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+# Сохранённые списки рекомендаций меняются по одному изменению за раз:
+# каждое читает затронутые списки и переписывает их.
+_recommendations_lock = asyncio.Lock()
+# Порог каждого сохранённого списка (Recommendations.bar): по нему без
+# чтения из базы видно, может ли изменённая анкета попасть в список.
+_recommendation_bars = {}
+# Просмотренные анкеты: фильтры Блума активных пользователей.
+seen_profiles = SeenStore(_pool, SEEN_CACHE_SIZE)
+# Пользователи, подписанные на уведомления о новых анкетах.
+_subscribers = set()
+# Готовые тексты анкет: строятся при сохранении, при показе к ним
+# добавляется только строка совпавших навыков.
+cards = CardCache(CARD_CACHE_SIZE)
+# Число анкет по тегам и курсам: копия таблицы facets.
+facets = FacetCounts()
+# Последняя применённая запись журнала изменений и фоновая задача,
+# которая его дочитывает (только при start_change_sync).
+_change_seq = 0
+_change_sync_task = None
+_change_stats = {"applied": 0, "reloads": 0}
 
 def _ensure_tags_column(conn: sqlite3.Connection):
     """Гарантирует наличие колонки tags в таблице users."""
@@ -24,83 +254,584 @@ def _ensure_tags_column(conn: sqlite3.Connection):
     except Error as e:
         print(f"Ошибка при добавлении колонки tags: {e}")
 
-def init_db():
-    """Инициализация базы данных и создание таблицы users."""
-    conn = create_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT NOT NULL,
-                    course TEXT NOT NULL,
-                    photo_id TEXT,
-                    skills TEXT,
-                    tags TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+def _ensure_tag_mask_column(conn: sqlite3.Connection):
+    """Гарантирует наличие колонки tag_mask и заполняет её по колонке tags."""
+    try:
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA table_info(users)")
+        columns = {row["name"] for row in cursor.fetchall()}
+        if "tag_mask" not in columns:
+            cursor.execute("ALTER TABLE users ADD COLUMN tag_mask INTEGER NOT NULL DEFAULT 0")
+            rows = cursor.execute("SELECT user_id, tags FROM users").fetchall()
+            cursor.executemany(
+                "UPDATE users SET tag_mask = ? WHERE user_id = ?",
+                [(tags_to_mask(_split_tags(row["tags"])), row["user_id"]) for row in rows]
+            )
             conn.commit()
-            _ensure_tags_column(conn)
-        except Error as e:
-            print(f"Ошибка при создании таблицы: {e}")
-        finally:
-            conn.close()
+    except Error as e:
+        print(f"Ошибка при добавлении колонки tag_mask: {e}")
+
+def _split_tags(tags_str):
+    """Разбирает строку тегов вида "a,b,c" в множество."""
+    if not tags_str:
+        return set()
+    return {t.strip() for t in tags_str.split(",") if t.strip()}
+
+def _ensure_users_fts_table(conn: sqlite3.Connection):
+    """Создает полнотекстовый индекс описаний и заполняет его при первом запуске."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'"
+    ).fetchone()
+    conn.execute(SQL_CREATE_USERS_FTS)
+    if not exists:
+        conn.execute("INSERT INTO users_fts (rowid, skills) SELECT user_id, skills FROM users WHERE skills != ''")
+    conn.commit()
 
-def add_user(user_id, username, course, photo_id=None, skills=None, tags=None):
-    """Добавление или обновление анкеты пользователя."""
-    conn = create_connection()
-    if conn:
+def _init_schema(conn: sqlite3.Connection):
+    conn.execute(SQL_CREATE_USERS)
+    conn.commit()
+    _ensure_tags_column(conn)
+    _ensure_tag_mask_column(conn)
+    # Индекс тегов user_tags не нужен с тех пор, как поиск идёт по маскам в памяти.
+    conn.execute("DROP TABLE IF EXISTS user_tags")
+    _ensure_users_fts_table(conn)
+    init_recommendations(conn)
+    init_seen(conn)
+    init_notifications(conn)
+    init_changes(conn)
+    init_facets(conn)
+    return conn.execute(SQL_GET_TAG_MASKS).fetchall()
+
+def _load_snapshot(conn: sqlite3.Connection):
+    return ProfileSnapshot.from_rows(conn.execute(SQL_GET_SNAPSHOT_ROWS))
+
+def user_row(user_id, username, course, photo_id=None, skills=None, tags=None):
+    """Кортеж анкеты для записи в users вместе с маской тегов."""
+    return (user_id, username, course, photo_id, skills, tags, tags_to_mask(_split_tags(tags)))
+
+def _write_users(conn: sqlite3.Connection, rows):
+    """Записывает анкеты (кортежи user_row) вместе с полнотекстовым индексом.
+
+    Транзакцией управляет вызывающий, поэтому пакет любого размера
+    записывается одним коммитом.
+    """
+    conn.executemany(SQL_UPSERT_USER, rows)
+    conn.executemany(SQL_DELETE_USER_FTS, [(row[0],) for row in rows])
+    conn.executemany(SQL_INSERT_USER_FTS, [(row[0], row[4]) for row in rows if row[4]])
+
+def _get_user(conn: sqlite3.Connection, user_id):
+    return conn.execute(SQL_GET_USER, (user_id,)).fetchone()
+
+def _apply_writes(conn: sqlite3.Connection, rows, deleted_ids):
+    """Записывает пакет анкет и удалений одной транзакцией.
+
+    Возвращает изменения счётчиков facets.
+    """
+    with conn:
+        # Счётчики считаются по старым строкам: никто не должен изменить
+        # их между чтением и записью, в том числе другой процесс бота.
+        conn.execute("BEGIN IMMEDIATE")
+        deltas = write_facet_changes(conn, rows, deleted_ids)
+        if rows:
+            record_new_profiles(conn, rows)
+            _write_users(conn, rows)
+        if deleted_ids:
+            params = [(user_id,) for user_id in deleted_ids]
+            conn.executemany(SQL_DELETE_USER, params)
+            conn.executemany(SQL_DELETE_USER_FTS, params)
+        log_changes(conn, CHANGE_PROFILE, [row[0] for row in rows] + list(deleted_ids))
+    return deltas
+
+# add_user и delete_user пишут через общую очередь: одновременные
+# сохранения анкет уходят в базу одним коммитом.
+_write_queue = WriteQueue(_pool, _apply_writes, WRITE_BATCH_DELAY, WRITE_BATCH_SIZE, on_applied=facets.apply)
+
+def _get_users_by_ids(conn: sqlite3.Connection, user_ids):
+    sql = SQL_GET_USERS_BY_IDS.format(placeholders=", ".join("?" * len(user_ids)))
+    rows = {row["user_id"]: row for row in conn.execute(sql, user_ids).fetchall()}
+    return [rows[user_id] for user_id in user_ids if user_id in rows]
+
+def _get_users_after(conn: sqlite3.Connection, after_user_id, limit):
+    return conn.execute(SQL_GET_USERS_AFTER, (after_user_id, limit)).fetchall()
+
+_WORD_RE = re.compile(r"\w+")
+# Окончания русских слов отбрасываются, а слово ищется по префиксу:
+# «дизайнера» находит и «дизайнер», и «дизайнеров».
+_RU_ENDING_CHARS = "аеёиоуыэюяйь"
+
+def _fts_query(text):
+    """Запрос FTS5 из произвольного текста: любое из слов, по префиксу.
+
+    Возвращает None, если в тексте нет ни одного слова.
+    """
+    terms = []
+    for word in _WORD_RE.findall(text.lower()):
+        stripped = 0
+        while len(word) > 4 and stripped < 2 and word[-1] in _RU_ENDING_CHARS:
+            word = word[:-1]
+            stripped += 1
+        term = f'"{word}"*'
+        if term not in terms:
+            terms.append(term)
+    return " OR ".join(terms) or None
+
+def _search_text(conn: sqlite3.Connection, query, query_mask, limit):
+    rows = conn.execute(SQL_SEARCH_TEXT, (query, query_mask, query_mask, limit))
+    return [row["user_id"] for row in rows]
+
+async def init_db(path=None):
+    """Инициализация базы данных и создание таблицы users.
+
+    path позволяет открыть другой файл базы (например, в бенчмарках).
+    """
+    global _pool
+    if path is not None and path != _pool.path:
+        await close_db()
+        _pool = ConnectionPool(path)
+        profile_cache.clear()
+        _text_cache.clear()
+    seen_profiles.attach(_pool)
+    _write_queue.attach(_pool)
+    try:
+        await _pool.run(_init_schema)
+    except Error as e:
+        print(f"Ошибка при создании таблицы: {e}")
+    else:
+        await _load_state()
+
+async def _load_state():
+    """Загружает в память индексы анкет, пороги рекомендаций и подписчиков."""
+    global _change_seq
+    try:
+        # Номер журнала читается до данных: изменения, записанные во время
+        # загрузки, будут применены повторно, а не потеряны.
+        _, latest = await _pool.run(get_change_range)
+        loaded = await _pool.run(_load_snapshot)
+        bars = await _pool.run(get_recommendation_bars)
+        subscribers = await _pool.run(get_subscribers)
+        facet_rows = await _pool.run(get_facets)
+    except Error as e:
+        print(f"Ошибка при загрузке анкет: {e}")
+        return
+    _change_seq = latest
+    snapshot.load(loaded)
+    scorer.load(zip(loaded.ids, loaded.masks))
+    profile_cache.clear()
+    cards.clear()
+    _text_cache.clear()
+    _recommendation_bars.clear()
+    _recommendation_bars.update(bars)
+    _subscribers.clear()
+    _subscribers.update(subscribers)
+    facets.load(facet_rows)
+
+async def close_db():
+    """Закрытие пула подключений к базе данных."""
+    await stop_change_sync()
+    await _write_queue.close()
+    await snapshot.close()
+    await seen_profiles.close()
+    await asyncio.get_running_loop().run_in_executor(None, _pool.close)
+
+def _recommendation_owners(user_id, old_mask, new_mask):
+    """Пары (владелец списка, новое число совпадений) для затронутых списков.
+
+    Анкета влияет только на анкеты с общим тегом со старой или новой маской
+    (их находит масочный индекс), и только на те списки, порог которых не
+    выше большего из старого и нового числа совпадений.
+    """
+    owners = []
+    bars = _recommendation_bars
+    query_mask = old_mask | new_mask
+    # Обходим меньшее из двух: сохранённые списки или анкеты с общим тегом.
+    if len(bars) < len(scorer):
+        candidates = ((owner, scorer.mask_of(owner)) for owner in bars)
+        candidates = ((owner, mask) for owner, mask in candidates if mask is not None and mask & query_mask)
+    else:
+        candidates = scorer.sharing(query_mask)
+    for owner, mask in candidates:
+        bar = bars.get(owner)
+        if bar is None or owner == user_id:
+            continue
+        score = overlap(mask, new_mask)
+        if bar <= max(score, overlap(mask, old_mask)):
+            owners.append((owner, score))
+    return owners
+
+def _build_recommendations(user_id):
+    mask = scorer.mask_of(user_id) or 0
+    return Recommendations.from_ranking(scorer.top_k(mask, RECOMMENDATIONS_CAP, user_id))
+
+async def _update_recommendations(user_id, old_mask, new_mask):
+    """Переносит смену тегов анкеты в сохранённые списки рекомендаций."""
+    async with _recommendations_lock:
+        owners = _recommendation_owners(user_id, old_mask, new_mask)
+        if not owners and user_id not in _recommendation_bars:
+            return
         try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO users (user_id, username, course, photo_id, skills, tags)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, username, course, photo_id, skills, tags))
-            conn.commit()
+            refill, bars = await _pool.run(apply_profile_change, user_id, owners)
+            _recommendation_bars.pop(user_id, None)
+            _recommendation_bars.update(bars)
+            if refill:
+                rebuilt = {owner: _build_recommendations(owner) for owner in refill}
+                await _pool.run(put_many_recommendations, [r.to_row(owner) for owner, r in rebuilt.items()])
+                _recommendation_bars.update((owner, r.bar) for owner, r in rebuilt.items())
         except Error as e:
-            print(f"Ошибка при добавлении пользователя: {e}")
-        finally:
-            conn.close()
+            print(f"Ошибка при обновлении рекомендаций: {e}")
+
+async def add_user(user_id, username, course, photo_id=None, skills=None, tags=None) -> bool:
+    """Добавление или обновление анкеты пользователя.
+
+    Возвращает False, если анкету записать не удалось.
+    """
+    row = user_row(user_id, username, course, photo_id, skills, tags)
+    old_mask = scorer.mask_of(user_id)
+    try:
+        await _write_queue.submit(user_id, row)
+    except Error as e:
+        print(f"Ошибка при добавлении пользователя: {e}")
+        return False
+    else:
+        scorer.upsert(user_id, row[-1])
+        profile = Profile.from_row(row)
+        snapshot.record(user_id, profile)
+        cards.put(profile)
+        for hook in profile_hooks:
+            hook(user_id, old_mask, row[-1])
+        if old_mask != row[-1]:
+            await _update_recommendations(user_id, old_mask or 0, row[-1])
+        return True
+    finally:
+        profile_cache.invalidate(user_id)
 
-def get_user(user_id):
+async def get_user(user_id):
     """Получение анкеты пользователя по user_id."""
-    conn = create_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-            return cursor.fetchone()
-        except Error as e:
-            print(f"Ошибка при получении пользователя: {e}")
-        finally:
-            conn.close()
+    found = snapshot.get(user_id)
+    if found is not MISSING:
+        return found
+    cached = profile_cache.get(user_id)
+    if cached is not MISSING:
+        return cached
+    token = profile_cache.begin()
+    try:
+        row = await _pool.run(_get_user, user_id)
+    except Error as e:
+        print(f"Ошибка при получении пользователя: {e}")
+    else:
+        user = Profile.from_row(row) if row is not None else None
+        profile_cache.put(user_id, user, token)
+        return user
     return None
 
-def delete_user(user_id):
+async def delete_user(user_id):
     """Удаление анкеты пользователя."""
-    conn = create_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
-            conn.commit()
-        except Error as e:
-            print(f"Ошибка при удалении пользователя: {e}")
-        finally:
-            conn.close()
+    old_mask = scorer.mask_of(user_id)
+    try:
+        await _write_queue.submit(user_id, None)
+    except Error as e:
+        print(f"Ошибка при удалении пользователя: {e}")
+    else:
+        scorer.remove(user_id)
+        snapshot.record(user_id, None)
+        cards.invalidate(user_id)
+        if old_mask is not None:
+            await _update_recommendations(user_id, old_mask, 0)
+    finally:
+        profile_cache.invalidate(user_id)
 
-def get_all_users(exclude_user_id):
-    """Получение всех анкет, кроме анкеты текущего пользователя."""
-    conn = create_connection()
-    if conn:
+def profile_card(user) -> ProfileCard:
+    """Карточка анкеты для показа (см. database/cards.py)."""
+    return cards.get(user)
+
+async def get_users_by_ids(user_ids):
+    """Анкеты с указанными user_id в том же порядке."""
+    user_ids = list(user_ids)
+    if snapshot.ready:
+        return [p for p in map(snapshot.get, user_ids) if p is not None]
+    found = {}
+    for user_id in user_ids:
+        cached = profile_cache.get(user_id)
+        if cached is not MISSING:
+            found[user_id] = cached
+    missing = [user_id for user_id in user_ids if user_id not in found]
+    if missing:
+        token = profile_cache.begin()
         try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM users WHERE user_id != ?", (exclude_user_id,))
-            return cursor.fetchall()
+            rows = await _pool.run(_get_users_by_ids, missing)
         except Error as e:
             print(f"Ошибка при получении пользователей: {e}")
-        finally:
-            conn.close()
-    return []
\ No newline at end of file
+            rows = []
+        for row in rows:
+            user = Profile.from_row(row)
+            profile_cache.put(user.user_id, user, token)
+            found[user.user_id] = user
+    return [found[user_id] for user_id in user_ids if found.get(user_id) is not None]
+
+async def get_ranked_page(query_mask, exclude_user_id, offset, limit=1, only_matching=True):
+    """Анкеты на позициях [offset, offset + limit) выдачи по маске тегов.
+
+    Ранжирование берётся из кэша запросов или считается масочным индексом,
+    поэтому вызывающему достаточно хранить только запрос и позицию.
+    """
+    user_ids = query_cache.window(query_mask, offset, limit, exclude_user_id, only_matching)
+    return await get_users_by_ids(user_ids)
+
+async def _get_recommendations(user_id):
+    """Сохранённый список пользователя; строится при первом обращении."""
+    try:
+        stored = await _pool.run(get_recommendations, user_id)
+        if stored is not None or scorer.mask_of(user_id) is None:
+            return stored
+        async with _recommendations_lock:
+            built = _build_recommendations(user_id)
+            await _pool.run(put_recommendations, user_id, built)
+            _recommendation_bars[user_id] = built.bar
+        return built
+    except Error as e:
+        print(f"Ошибка при получении рекомендаций: {e}")
+    return None
+
+async def get_recommended_page(user_id, query_mask, offset, limit=1):
+    """Анкеты на позициях [offset, offset + limit) выдачи /search для user_id.
+
+    Первые позиции берутся из сохранённого списка рекомендаций, дальше
+    выдача продолжается общим ранжированием по маске тегов: список —
+    точный префикс этого ранжирования.
+    """
+    stored = await _get_recommendations(user_id)
+    user_ids = stored.ids[offset:offset + limit].tolist() if stored is not None else []
+    if len(user_ids) < limit:
+        start = offset + len(user_ids)
+        user_ids += query_cache.window(query_mask, start, limit - len(user_ids), user_id, only_matching=False)
+    return await get_users_by_ids(user_ids)
+
+def tag_counts():
+    """Число анкет с каждым тегом в порядке TAGS."""
+    return facets.tag_counts()
+
+def has_tag_matches(query_mask, exclude_user_id):
+    """Есть ли анкеты хотя бы с одним тегом из query_mask, кроме анкеты exclude_user_id."""
+    return facets.has_matches(query_mask, scorer.mask_of(exclude_user_id) or 0)
+
+def count_ranked_users(query_mask, exclude_user_id, only_matching=True):
+    """Общее число анкет в выдаче по маске тегов."""
+    return query_cache.count(query_mask, exclude_user_id, only_matching)
+
+async def _text_ranking(text, query_mask):
+    """user_id лучших совпадений по описанию; листание страниц не повторяет запрос."""
+    query = _fts_query(text)
+    if query is None:
+        return []
+    key = (query, query_mask)
+    epoch = scorer.epoch
+    cached = _text_cache.get(key)
+    if cached is not None and cached[0] == epoch:
+        _text_cache.move_to_end(key)
+        return cached[1]
+    try:
+        user_ids = await _pool.run(_search_text, query, query_mask, TEXT_SEARCH_LIMIT)
+    except Error as e:
+        print(f"Ошибка при поиске пользователей по описанию: {e}")
+        return []
+    # Анкеты могли измениться, пока шёл запрос: тогда выдачу не кэшируем.
+    if epoch == scorer.epoch:
+        _text_cache[key] = (epoch, user_ids)
+        while len(_text_cache) > TEXT_CACHE_SIZE:
+            _text_cache.popitem(last=False)
+    return user_ids
+
+async def search_by_text(text, query_mask, exclude_user_id, offset=0, limit=1):
+    """Анкеты на позициях [offset, offset + limit) поиска по описанию.
+
+    Анкеты ранжируются по bm25; при ненулевой query_mask остаются только
+    анкеты хотя бы с одним тегом из маски.
+    """
+    user_ids = [u for u in await _text_ranking(text, query_mask) if u != exclude_user_id]
+    return await get_users_by_ids(user_ids[offset:offset + limit])
+
+async def count_text_matches(text, query_mask, exclude_user_id):
+    """Число анкет в выдаче поиска по описанию (не больше TEXT_SEARCH_LIMIT)."""
+    user_ids = await _text_ranking(text, query_mask)
+    return len(user_ids) - (exclude_user_id in user_ids)
+
+async def start_seen_session(user_id) -> SeenProfiles:
+    """Начинает новый поиск пользователя: показанное раньше будет пропускаться."""
+    seen = await seen_profiles.get(user_id)
+    if seen.start_session():
+        seen_profiles.touch(user_id)
+    return seen
+
+async def get_seen(user_id) -> SeenProfiles:
+    """Просмотренные пользователем анкеты."""
+    return await seen_profiles.get(user_id)
+
+async def mark_seen(user_id, profile_id):
+    """Отмечает анкету profile_id показанной пользователю user_id."""
+    seen = await seen_profiles.get(user_id)
+    if seen.mark(profile_id):
+        seen_profiles.touch(user_id)
+
+async def set_subscription(user_id, subscribed):
+    """Подписка на уведомления о новых анкетах с общими тегами (или отписка)."""
+    try:
+        await _pool.run(put_subscription, user_id, subscribed)
+    except Error as e:
+        print(f"Ошибка при изменении подписки: {e}")
+        return
+    if subscribed:
+        _subscribers.add(user_id)
+    else:
+        _subscribers.discard(user_id)
+
+def find_subscribers(user_id, tag_mask):
+    """Подписчики, у которых есть общий тег с анкетой user_id."""
+    if not tag_mask or not _subscribers:
+        return []
+    # Подписчиков обычно меньше, чем анкет с общим тегом: проверяем их маски.
+    if len(_subscribers) < len(scorer):
+        return [s for s in _subscribers if s != user_id and (scorer.mask_of(s) or 0) & tag_mask]
+    return [owner for owner, _ in scorer.sharing(tag_mask) if owner in _subscribers and owner != user_id]
+
+async def get_new_profile_batch(limit):
+    """Пачка новых анкет, о которых ещё не разосланы уведомления."""
+    try:
+        return await _pool.run(get_new_profiles, limit)
+    except Error as e:
+        print(f"Ошибка при чтении новых анкет: {e}")
+    return []
+
+async def queue_notifications(recipients) -> bool:
+    """Кладёт уведомления {анкета: получатели} в очередь рассылки; False при ошибке."""
+    try:
+        await _pool.run(enqueue_notifications, recipients)
+    except Error as e:
+        print(f"Ошибка при постановке уведомлений в очередь: {e}")
+        return False
+    return True
+
+async def get_notifications(limit):
+    """Самые старые неотправленные уведомления."""
+    try:
+        return await _pool.run(get_pending_notifications, limit)
+    except Error as e:
+        print(f"Ошибка при чтении очереди уведомлений: {e}")
+    return []
+
+async def finish_notification_batch(done, retry):
+    try:
+        await _pool.run(finish_notifications, done, retry)
+    except Error as e:
+        print(f"Ошибка при обновлении очереди уведомлений: {e}")
+
+async def _apply_profile_changes(user_ids):
+    rows = {row["user_id"]: row for row in await _pool.run(_get_users_by_ids, user_ids)}
+    for user_id in user_ids:
+        row = rows.get(user_id)
+        profile = Profile.from_row(row) if row is not None else None
+        # Свои же записи уже учтены в add_user/delete_user: не трогаем то,
+        # что совпадает с базой, чтобы не сбрасывать кэши выдачи зря.
+        mask = profile.tag_mask if profile is not None else None
+        if snapshot.get(user_id) == profile and scorer.mask_of(user_id) == mask:
+            continue
+        if profile is None:
+            scorer.remove(user_id)
+            cards.invalidate(user_id)
+        else:
+            scorer.upsert(user_id, mask)
+            cards.put(profile)
+        snapshot.record(user_id, profile)
+        profile_cache.invalidate(user_id)
+
+async def _apply_recommendation_changes(owners):
+    async with _recommendations_lock:
+        bars = await _pool.run(get_many_recommendation_bars, owners)
+        for owner in owners:
+            if owner in bars:
+                _recommendation_bars[owner] = bars[owner]
+            else:
+                _recommendation_bars.pop(owner, None)
+
+async def _apply_subscription_changes(user_ids):
+    subscribed = set(await _pool.run(get_subscribed, user_ids))
+    for user_id in user_ids:
+        if user_id in subscribed:
+            _subscribers.add(user_id)
+        else:
+            _subscribers.discard(user_id)
+
+async def sync_changes():
+    """Применяет к памяти процесса изменения из журнала, в том числе чужие.
+
+    Возвращает число прочитанных записей. Если журнал обрезан раньше, чем
+    процесс его дочитал, состояние загружается из базы заново.
+    """
+    global _change_seq
+    try:
+        oldest, changes = await _pool.run(get_changes, _change_seq, CHANGE_SYNC_BATCH)
+        if oldest > _change_seq + 1:
+            _change_stats["reloads"] += 1
+            await _load_state()
+            return 0
+        if not changes:
+            return 0
+        by_kind = {CHANGE_PROFILE: {}, CHANGE_RECOMMENDATIONS: {}, CHANGE_SUBSCRIPTION: {}}
+        for change in changes:
+            by_kind[change["kind"]][change["user_id"]] = None
+        if by_kind[CHANGE_PROFILE]:
+            await _apply_profile_changes(list(by_kind[CHANGE_PROFILE]))
+            facets.load(await _pool.run(get_facets))
+        if by_kind[CHANGE_RECOMMENDATIONS]:
+            await _apply_recommendation_changes(list(by_kind[CHANGE_RECOMMENDATIONS]))
+        if by_kind[CHANGE_SUBSCRIPTION]:
+            await _apply_subscription_changes(list(by_kind[CHANGE_SUBSCRIPTION]))
+    except Error as e:
+        print(f"Ошибка при чтении журнала изменений: {e}")
+        return 0
+    _change_seq = changes[-1]["seq"]
+    _change_stats["applied"] += len(changes)
+    return len(changes)
+
+async def _change_sync_loop(interval):
+    last_trim = time.monotonic()
+    while True:
+        try:
+            read = await sync_changes()
+        except Exception as e:
+            print(f"Ошибка при применении журнала изменений: {e}")
+            read = 0
+        if read < CHANGE_SYNC_BATCH:
+            await asyncio.sleep(interval)
+        if time.monotonic() - last_trim >= CHANGE_LOG_TTL / 10:
+            last_trim = time.monotonic()
+            try:
+                await _pool.run(trim_changes, time.time() - CHANGE_LOG_TTL)
+            except Error as e:
+                print(f"Ошибка при очистке журнала изменений: {e}")
+
+def start_change_sync(interval=CHANGE_SYNC_INTERVAL):
+    """Включает журнал изменений и его фоновое чтение.
+
+    Нужен, когда с базой одновременно работают несколько процессов бота
+    (app/cluster.py): изменения анкет, рекомендаций и подписок, сделанные
+    другими процессами, попадают в индексы в памяти не позже чем через
+    interval секунд.
+    """
+    global _change_sync_task
+    enable_change_log()
+    if _change_sync_task is None:
+        _change_sync_task = asyncio.create_task(_change_sync_loop(interval))
+
+async def stop_change_sync():
+    global _change_sync_task
+    if _change_sync_task is None:
+        return
+    _change_sync_task.cancel()
+    try:
+        await _change_sync_task
+    except asyncio.CancelledError:
+        pass
+    _change_sync_task = None
+
+def change_stats():
+    """Номер последней применённой записи журнала и счётчики синхронизации."""
+    return {"seq": _change_seq, **_change_stats}
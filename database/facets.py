@@ -0,0 +1,120 @@
+import sqlite3
+from collections import Counter
+from typing import Dict, Iterable, Tuple
+
+from database.scoring import TAG_BITS
+
+# Ограничение на число параметров в одном запросе IN (...).
+_CHUNK = 500
+
+FACET_TOTAL = "total"
+FACET_TAG = "tag"
+FACET_COURSE = "course"
+
+# Число анкет с каждым тегом и каждым курсом. Счётчики меняются в той же
+# транзакции, что и анкеты, поэтому после перезапуска читаются как есть.
+# Строка (total, '') служит и признаком того, что таблица уже заполнена.
+SQL_CREATE_FACETS = '''
+    CREATE TABLE IF NOT EXISTS facets (
+        kind TEXT NOT NULL,
+        value TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (kind, value)
+    ) WITHOUT ROWID
+'''
+SQL_GET_FACETS = "SELECT kind, value, count FROM facets"
+SQL_ADD_FACET = '''
+    INSERT INTO facets (kind, value, count) VALUES (?, ?, ?)
+    ON CONFLICT (kind, value) DO UPDATE SET count = count + excluded.count
+'''
+SQL_CLEAR_FACETS = "DELETE FROM facets"
+SQL_GET_FACET_FIELDS = "SELECT user_id, course, tag_mask FROM users WHERE user_id IN ({placeholders})"
+SQL_COUNT_MASKS = "SELECT tag_mask, course, COUNT(*) AS n FROM users GROUP BY tag_mask, course"
+
+class FacetCounts:
+    """Счётчики анкет по тегам и курсам в памяти (копия таблицы facets)."""
+
+    __slots__ = ("tags", "courses", "total")
+
+    def __init__(self):
+        self.tags: Dict[str, int] = dict.fromkeys(TAG_BITS, 0)
+        self.courses: Dict[str, int] = {}
+        self.total = 0
+
+    def load(self, rows: Iterable[Tuple[str, str, int]]):
+        self.tags = dict.fromkeys(TAG_BITS, 0)
+        self.courses = {}
+        self.total = 0
+        self.apply({(kind, value): count for kind, value, count in rows})
+
+    def apply(self, deltas: Dict[Tuple[str, str], int]):
+        """Прибавляет изменения счётчиков {(вид, значение): разница}."""
+        for (kind, value), delta in deltas.items():
+            if kind == FACET_TAG:
+                if value in self.tags:
+                    self.tags[value] += delta
+            elif kind == FACET_COURSE:
+                self.courses[value] = self.courses.get(value, 0) + delta
+            elif kind == FACET_TOTAL:
+                self.total += delta
+
+    def tag_counts(self) -> Tuple[int, ...]:
+        """Число анкет с каждым тегом в порядке TAGS."""
+        return tuple(self.tags.values())
+
+    def has_matches(self, query_mask: int, exclude_mask: int = 0) -> bool:
+        """Есть ли анкеты хотя бы с одним тегом из query_mask, кроме анкеты с маской exclude_mask."""
+        return any(
+            self.tags[tag] - bool(exclude_mask & bit) > 0
+            for tag, bit in TAG_BITS.items() if query_mask & bit
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {"total": self.total, **{f"course:{course}": n for course, n in self.courses.items()}}
+
+def _count(deltas: Counter, course: str, mask: int, n: int):
+    """Прибавляет n анкет с курсом course и маской mask (n < 0 — вычитает)."""
+    deltas[(FACET_TOTAL, "")] += n
+    deltas[(FACET_COURSE, course or "")] += n
+    for tag, bit in TAG_BITS.items():
+        if mask & bit:
+            deltas[(FACET_TAG, tag)] += n
+
+def init_facets(conn: sqlite3.Connection):
+    """Создает таблицу счётчиков и заполняет её по users при первом запуске."""
+    conn.execute(SQL_CREATE_FACETS)
+    conn.commit()
+    if not conn.execute("SELECT 1 FROM facets WHERE kind = ?", (FACET_TOTAL,)).fetchone():
+        rebuild_facets(conn)
+
+def get_facets(conn: sqlite3.Connection):
+    return conn.execute(SQL_GET_FACETS).fetchall()
+
+def write_facet_changes(conn: sqlite3.Connection, rows, deleted_ids) -> Dict[Tuple[str, str], int]:
+    """Переносит в счётчики запись анкет rows (кортежи user_row) и удаление deleted_ids.
+
+    Вызывается в транзакции записи до изменения users: старые курс и маска
+    читаются из базы. Возвращает изменения счётчиков для FacetCounts.apply.
+    """
+    ids = [row[0] for row in rows] + list(deleted_ids)
+    deltas: Counter = Counter()
+    for start in range(0, len(ids), _CHUNK):
+        chunk = ids[start:start + _CHUNK]
+        sql = SQL_GET_FACET_FIELDS.format(placeholders=", ".join("?" * len(chunk)))
+        for old in conn.execute(sql, chunk):
+            _count(deltas, old["course"], old["tag_mask"], -1)
+    for row in rows:
+        _count(deltas, row[2], row[6], 1)
+    changed = {key: delta for key, delta in deltas.items() if delta}
+    conn.executemany(SQL_ADD_FACET, [(kind, value, delta) for (kind, value), delta in changed.items()])
+    return changed
+
+def rebuild_facets(conn: sqlite3.Connection):
+    """Пересчитывает все счётчики по users (после массовой записи в обход add_user)."""
+    deltas: Counter = Counter()
+    deltas[(FACET_TOTAL, "")] = 0
+    for row in conn.execute(SQL_COUNT_MASKS):
+        _count(deltas, row["course"], row["tag_mask"], row["n"])
+    with conn:
+        conn.execute(SQL_CLEAR_FACETS)
+        conn.executemany(SQL_ADD_FACET, [(kind, value, n) for (kind, value), n in deltas.items()])
@@ -0,0 +1,284 @@
+import asyncio
+import json
+import sqlite3
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from database.db import ConnectionPool
+
+FSM_DB_PATH = "fsm.db"
+
+SQL_CREATE_SESSIONS = '''
+    CREATE TABLE IF NOT EXISTS fsm_sessions (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    )
+'''
+SQL_CREATE_SESSIONS_INDEX = "CREATE INDEX IF NOT EXISTS idx_fsm_sessions_updated ON fsm_sessions (updated_at)"
+SQL_GET_SESSION = "SELECT state, data, updated_at FROM fsm_sessions WHERE key = ?"
+SQL_UPSERT_SESSION = "INSERT OR REPLACE INTO fsm_sessions (key, state, data, updated_at) VALUES (?, ?, ?, ?)"
+SQL_DELETE_SESSION = "DELETE FROM fsm_sessions WHERE key = ?"
+SQL_EXPIRE_SESSIONS = "DELETE FROM fsm_sessions WHERE updated_at < ?"
+
+class _Session:
+    # active_at — время последнего обращения (time.time()); для сессии,
+    # прочитанной из базы, — время её последней записи. size — длина JSON
+    # данных при последней записи или чтении.
+    __slots__ = ("state", "data", "active_at", "size")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], active_at: Optional[float] = None, size: int = 0):
+        self.state = state
+        self.data = data
+        self.active_at = time.time() if active_at is None else active_at
+        self.size = size
+
+def _init_schema(conn: sqlite3.Connection):
+    conn.execute(SQL_CREATE_SESSIONS)
+    conn.execute(SQL_CREATE_SESSIONS_INDEX)
+    conn.commit()
+
+def _load_session(conn: sqlite3.Connection, key: str):
+    return conn.execute(SQL_GET_SESSION, (key,)).fetchone()
+
+def _write_sessions(conn: sqlite3.Connection, upserts, deletes):
+    with conn:
+        conn.executemany(SQL_UPSERT_SESSION, upserts)
+        conn.executemany(SQL_DELETE_SESSION, deletes)
+
+def _expire_sessions(conn: sqlite3.Connection, before: float):
+    with conn:
+        conn.execute(SQL_EXPIRE_SESSIONS, (before,))
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM в SQLite с отложенной пакетной записью.
+
+    Активные сессии живут в памяти; изменения копятся и сбрасываются в базу
+    одной транзакцией раз в flush_interval секунд или при накоплении
+    batch_size изменённых ключей. Сессии без обращений дольше idle_ttl
+    выгружаются из памяти (и при следующем обращении читаются из базы), а
+    записи старше session_ttl удаляются из базы.
+
+    Ключи данных с префиксами volatile_prefixes (например, состояние
+    поиска) удаляются, если к сессии не обращались дольше volatile_ttl.
+    Если сессии в памяти занимают больше memory_budget байт (по длине их
+    JSON), записанные в базу сессии выгружаются раньше срока: самые давние
+    (evict_policy="oldest") или самые большие (evict_policy="largest").
+    """
+
+    def __init__(
+        self,
+        path: str = FSM_DB_PATH,
+        *,
+        key_builder: Optional[KeyBuilder] = None,
+        flush_interval: float = 1.0,
+        batch_size: int = 500,
+        idle_ttl: float = 600.0,
+        session_ttl: float = 30 * 24 * 3600.0,
+        sweep_interval: float = 60.0,
+        volatile_prefixes: Tuple[str, ...] = (),
+        volatile_ttl: Optional[float] = None,
+        memory_budget: Optional[int] = None,
+        evict_policy: str = "oldest",
+    ):
+        if evict_policy not in ("oldest", "largest"):
+            raise ValueError(f"неизвестная политика вытеснения: {evict_policy}")
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.idle_ttl = idle_ttl
+        self.session_ttl = session_ttl
+        self.sweep_interval = sweep_interval
+        self.volatile_prefixes = tuple(volatile_prefixes)
+        self.volatile_ttl = volatile_ttl
+        self.memory_budget = memory_budget
+        self.evict_policy = evict_policy
+        self._pool = ConnectionPool(path, size=1)
+        self._sessions: Dict[str, _Session] = {}
+        self._dirty = set()
+        self._ready: Optional[asyncio.Future] = None
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_sweep = time.monotonic()
+        self._resident_bytes = 0
+        self.expired = 0
+        self.evicted_idle = 0
+        self.evicted_budget = 0
+
+    async def start(self):
+        """Запускает фоновую запись и чистку, не дожидаясь первого апдейта."""
+        await self._start()
+
+    async def _start(self):
+        """Создает таблицу и запускает фоновую запись при первом обращении."""
+        if self._ready is None:
+            self._ready = asyncio.get_running_loop().create_future()
+            try:
+                await self._pool.run(_init_schema)
+            except BaseException as e:
+                self._ready.set_exception(e)
+                self._ready = None
+                raise
+            self._flush_requested = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_loop())
+            self._ready.set_result(None)
+        await self._ready
+
+    async def _session(self, key: StorageKey) -> _Session:
+        await self._start()
+        name = self.key_builder.build(key)
+        session = self._sessions.get(name)
+        if session is None:
+            row = await self._pool.run(_load_session, name)
+            if row:
+                loaded = _Session(row["state"], json.loads(row["data"]), row["updated_at"], len(row["data"]))
+            else:
+                loaded = _Session(None, {})
+            # Пока шло чтение, сессию мог создать параллельный вызов.
+            session = self._sessions.setdefault(name, loaded)
+            if session is loaded:
+                self._resident_bytes += loaded.size
+        now = time.time()
+        if self.volatile_ttl is not None and session.active_at < now - self.volatile_ttl:
+            self._expire_volatile(name, session)
+        session.active_at = now
+        return session
+
+    def _expire_volatile(self, name: str, session: _Session):
+        """Удаляет из данных сессии ключи с префиксами volatile_prefixes."""
+        if not self.volatile_prefixes or not any(k.startswith(self.volatile_prefixes) for k in session.data):
+            return
+        session.data = {k: v for k, v in session.data.items() if not k.startswith(self.volatile_prefixes)}
+        self._dirty.add(name)
+        self.expired += 1
+
+    def _mark_dirty(self, key: StorageKey):
+        self._dirty.add(self.key_builder.build(key))
+        if len(self._dirty) >= self.batch_size:
+            self._flush_requested.set()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        session = await self._session(key)
+        session.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._session(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        session = await self._session(key)
+        session.data = data.copy()
+        self._mark_dirty(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._session(key)).data.copy()
+
+    async def flush(self):
+        """Записывает все накопленные изменения одной транзакцией."""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        now = time.time()
+        upserts, deletes = [], []
+        for name in dirty:
+            session = self._sessions.get(name)
+            if session is None or (session.state is None and not session.data):
+                deletes.append((name,))
+                size = 0
+            else:
+                data = json.dumps(session.data, ensure_ascii=False)
+                upserts.append((name, session.state, data, now))
+                size = len(data)
+            if session is not None:
+                self._resident_bytes += size - session.size
+                session.size = size
+        try:
+            await self._pool.run(_write_sessions, upserts, deletes)
+        except BaseException:
+            # Не потерять изменения: вернуть ключи в очередь на следующую попытку.
+            self._dirty |= dirty
+            raise
+
+    def _evict(self, name: str):
+        self._resident_bytes -= self._sessions.pop(name).size
+
+    def _evict_idle(self, now: float):
+        deadline = now - self.idle_ttl
+        for name in [n for n, s in self._sessions.items() if s.active_at < deadline and n not in self._dirty]:
+            self._evict(name)
+            self.evicted_idle += 1
+
+    def _enforce_budget(self):
+        """Выгружает записанные в базу сессии, пока память не уложится в memory_budget."""
+        if self.memory_budget is None or self._resident_bytes <= self.memory_budget:
+            return
+        clean = [(n, s) for n, s in self._sessions.items() if n not in self._dirty]
+        if self.evict_policy == "largest":
+            clean.sort(key=lambda item: item[1].size, reverse=True)
+        else:
+            clean.sort(key=lambda item: item[1].active_at)
+        for name, _ in clean:
+            if self._resident_bytes <= self.memory_budget:
+                break
+            self._evict(name)
+            self.evicted_budget += 1
+
+    async def sweep(self):
+        """Удаляет устаревшие ключи, выгружает простаивающие сессии и чистит базу."""
+        now = time.time()
+        if self.volatile_ttl is not None:
+            deadline = now - self.volatile_ttl
+            for name, session in self._sessions.items():
+                if session.active_at < deadline:
+                    self._expire_volatile(name, session)
+        await self.flush()
+        self._evict_idle(now)
+        await self._pool.run(_expire_sessions, now - self.session_ttl)
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_sweep >= self.sweep_interval:
+                    self._last_sweep = time.monotonic()
+                    await self.sweep()
+                # Бюджет проверяется после каждой записи: сессии выгружаются,
+                # только когда их изменения уже в базе.
+                self._enforce_budget()
+            except sqlite3.Error as e:
+                print(f"Ошибка при сохранении состояний FSM: {e}")
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        try:
+            await self.flush()
+        except sqlite3.Error as e:
+            print(f"Ошибка при сохранении состояний FSM: {e}")
+        self._ready = None
+        await asyncio.get_running_loop().run_in_executor(None, self._pool.close)
+
+    def stats(self) -> Dict[str, int]:
+        """Сессии в памяти, их размер и счётчики чистки."""
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self._resident_bytes,
+            "dirty": len(self._dirty),
+            "expired": self.expired,
+            "evicted_idle": self.evicted_idle,
+            "evicted_budget": self.evicted_budget,
+        }
@@ -0,0 +1,57 @@
+from typing import List, Optional, Sequence
+
+from database.scoring import mask_to_tags
+
+class Profile:
+    """Анкета пользователя.
+
+    Теги хранятся только битовой маской, которая считается один раз при
+    чтении из базы; список тегов восстанавливается из неё по требованию.
+    """
+
+    __slots__ = ("user_id", "username", "course", "photo_id", "skills", "tag_mask")
+
+    def __init__(
+        self,
+        user_id: int,
+        username: str,
+        course: str,
+        photo_id: Optional[str] = None,
+        skills: Optional[str] = None,
+        tag_mask: int = 0,
+    ):
+        self.user_id = user_id
+        self.username = username
+        self.course = course
+        self.photo_id = photo_id or None
+        self.skills = skills or None
+        self.tag_mask = tag_mask
+
+    @classmethod
+    def from_row(cls, row) -> "Profile":
+        """Анкета из строки users (sqlite3.Row) или кортежа user_row."""
+        if isinstance(row, tuple):
+            user_id, username, course, photo_id, skills, _, tag_mask = row
+            return cls(user_id, username, course, photo_id, skills, tag_mask)
+        return cls(row["user_id"], row["username"], row["course"], row["photo_id"], row["skills"], row["tag_mask"])
+
+    @property
+    def tags(self) -> List[str]:
+        """Теги анкеты в порядке TAGS."""
+        return mask_to_tags(self.tag_mask)
+
+    def to_state(self) -> list:
+        """Компактное представление для FSM-состояния (JSON-совместимое)."""
+        return [self.user_id, self.username, self.course, self.photo_id, self.skills, self.tag_mask]
+
+    @classmethod
+    def from_state(cls, data: Sequence) -> "Profile":
+        return cls(*data)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Profile):
+            return NotImplemented
+        return self.to_state() == other.to_state()
+
+    def __repr__(self) -> str:
+        return f"Profile(user_id={self.user_id}, username={self.username!r})"
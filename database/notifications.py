@@ -0,0 +1,98 @@
+import sqlite3
+from typing import Dict, Iterable, List
+
+from database.changes import CHANGE_SUBSCRIPTION, log_changes
+
+SQL_CREATE_SUBSCRIPTIONS = '''
+    CREATE TABLE IF NOT EXISTS subscriptions (
+        user_id INTEGER PRIMARY KEY,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+# Очередь уведомлений: строка удаляется только после успешной отправки,
+# поэтому после перезапуска бота рассылка продолжается с того же места.
+SQL_CREATE_NOTIFICATIONS = '''
+    CREATE TABLE IF NOT EXISTS notifications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        recipient_id INTEGER NOT NULL,
+        profile_id INTEGER NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+# Новые анкеты, о которых ещё не разосланы уведомления. Строка пишется в
+# той же транзакции, что и анкета, и удаляется вместе с постановкой
+# уведомлений о ней в очередь: событие не теряется при остановке бота.
+SQL_CREATE_NEW_PROFILES = '''
+    CREATE TABLE IF NOT EXISTS new_profiles (
+        profile_id INTEGER PRIMARY KEY,
+        tag_mask INTEGER NOT NULL
+    )
+'''
+SQL_GET_SUBSCRIBERS = "SELECT user_id FROM subscriptions"
+SQL_GET_SUBSCRIBED = "SELECT user_id FROM subscriptions WHERE user_id IN ({placeholders})"
+SQL_INSERT_SUBSCRIPTION = "INSERT OR IGNORE INTO subscriptions (user_id) VALUES (?)"
+SQL_DELETE_SUBSCRIPTION = "DELETE FROM subscriptions WHERE user_id = ?"
+SQL_DELETE_RECIPIENT_NOTIFICATIONS = "DELETE FROM notifications WHERE recipient_id = ?"
+SQL_INSERT_NEW_PROFILE = '''
+    INSERT OR REPLACE INTO new_profiles (profile_id, tag_mask)
+    SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM users WHERE user_id = ?)
+'''
+SQL_GET_NEW_PROFILES = "SELECT profile_id, tag_mask FROM new_profiles ORDER BY profile_id LIMIT ?"
+SQL_DELETE_NEW_PROFILE = "DELETE FROM new_profiles WHERE profile_id = ?"
+SQL_INSERT_NOTIFICATION = "INSERT INTO notifications (recipient_id, profile_id) VALUES (?, ?)"
+SQL_GET_PENDING_NOTIFICATIONS = "SELECT id, recipient_id, profile_id, attempts FROM notifications ORDER BY id LIMIT ?"
+SQL_DELETE_NOTIFICATION = "DELETE FROM notifications WHERE id = ?"
+SQL_RETRY_NOTIFICATION = "UPDATE notifications SET attempts = attempts + 1 WHERE id = ?"
+
+def init_notifications(conn: sqlite3.Connection):
+    conn.execute(SQL_CREATE_SUBSCRIPTIONS)
+    conn.execute(SQL_CREATE_NOTIFICATIONS)
+    conn.execute(SQL_CREATE_NEW_PROFILES)
+    conn.commit()
+
+def get_subscribers(conn: sqlite3.Connection) -> List[int]:
+    return [row["user_id"] for row in conn.execute(SQL_GET_SUBSCRIBERS)]
+
+def get_subscribed(conn: sqlite3.Connection, user_ids: List[int]) -> List[int]:
+    """Кто из user_ids подписан."""
+    sql = SQL_GET_SUBSCRIBED.format(placeholders=", ".join("?" * len(user_ids)))
+    return [row["user_id"] for row in conn.execute(sql, user_ids)]
+
+def put_subscription(conn: sqlite3.Connection, user_id: int, subscribed: bool):
+    """Подписывает или отписывает пользователя; при отписке очередь для него очищается."""
+    with conn:
+        if subscribed:
+            conn.execute(SQL_INSERT_SUBSCRIPTION, (user_id,))
+        else:
+            conn.execute(SQL_DELETE_SUBSCRIPTION, (user_id,))
+            conn.execute(SQL_DELETE_RECIPIENT_NOTIFICATIONS, (user_id,))
+        log_changes(conn, CHANGE_SUBSCRIPTION, (user_id,))
+
+def record_new_profiles(conn: sqlite3.Connection, rows):
+    """Отмечает новые анкеты с тегами из rows (кортежи user_row) для рассылки.
+
+    Вызывается в транзакции записи до изменения users: новая — та анкета,
+    которой там ещё нет.
+    """
+    conn.executemany(SQL_INSERT_NEW_PROFILE, [(row[0], row[6], row[0]) for row in rows if row[6]])
+
+def get_new_profiles(conn: sqlite3.Connection, limit: int) -> List[sqlite3.Row]:
+    return conn.execute(SQL_GET_NEW_PROFILES, (limit,)).fetchall()
+
+def enqueue_notifications(conn: sqlite3.Connection, recipients: Dict[int, Iterable[int]]):
+    """Ставит уведомления {анкета: получатели} в очередь и снимает анкеты с рассылки."""
+    with conn:
+        conn.executemany(SQL_INSERT_NOTIFICATION, [
+            (recipient, profile_id) for profile_id, ids in recipients.items() for recipient in ids
+        ])
+        conn.executemany(SQL_DELETE_NEW_PROFILE, [(profile_id,) for profile_id in recipients])
+
+def get_pending_notifications(conn: sqlite3.Connection, limit: int) -> List[sqlite3.Row]:
+    return conn.execute(SQL_GET_PENDING_NOTIFICATIONS, (limit,)).fetchall()
+
+def finish_notifications(conn: sqlite3.Connection, done: Iterable[int], retry: Iterable[int]):
+    """Удаляет отправленные (или отброшенные) уведомления и учитывает неудачные попытки."""
+    with conn:
+        conn.executemany(SQL_DELETE_NOTIFICATION, [(i,) for i in done])
+        conn.executemany(SQL_RETRY_NOTIFICATION, [(i,) for i in retry])
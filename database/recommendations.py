@@ -0,0 +1,186 @@
+import sqlite3
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from database.changes import CHANGE_RECOMMENDATIONS, log_changes
+
+# Сколько лучших совпадений гарантированно лежит в списке пользователя.
+RECOMMENDATIONS_SIZE = 20
+# Списки строятся с запасом: удаление анкеты из списка не требует
+# пересчёта, пока в нём остаётся хотя бы RECOMMENDATIONS_SIZE позиций.
+RECOMMENDATIONS_CAP = 2 * RECOMMENDATIONS_SIZE
+# Ограничение на число параметров в одном запросе IN (...).
+_CHUNK = 500
+
+SQL_CREATE_RECOMMENDATIONS = '''
+    CREATE TABLE IF NOT EXISTS recommendations (
+        user_id INTEGER PRIMARY KEY,
+        ids BLOB NOT NULL,
+        scores BLOB NOT NULL,
+        complete INTEGER NOT NULL,
+        last_score INTEGER NOT NULL
+    )
+'''
+SQL_GET_RECOMMENDATIONS = "SELECT * FROM recommendations WHERE user_id = ?"
+SQL_GET_MANY_RECOMMENDATIONS = "SELECT * FROM recommendations WHERE user_id IN ({placeholders})"
+SQL_GET_RECOMMENDATION_BARS = "SELECT user_id, complete, last_score FROM recommendations"
+SQL_GET_MANY_RECOMMENDATION_BARS = "SELECT user_id, complete, last_score FROM recommendations WHERE user_id IN ({placeholders})"
+SQL_UPSERT_RECOMMENDATIONS = '''
+    INSERT OR REPLACE INTO recommendations (user_id, ids, scores, complete, last_score)
+    VALUES (?, ?, ?, ?, ?)
+'''
+SQL_DELETE_RECOMMENDATIONS = "DELETE FROM recommendations WHERE user_id = ?"
+SQL_CLEAR_RECOMMENDATIONS = "DELETE FROM recommendations"
+
+class Recommendations:
+    """Сохранённый список лучших совпадений пользователя.
+
+    Список — точный префикс ранжирования по убыванию общих тегов (при
+    равенстве — по user_id) среди анкет хотя бы с одним совпадением.
+    complete означает, что в списке все такие анкеты.
+    """
+
+    __slots__ = ("ids", "scores", "complete")
+
+    def __init__(self, ids: array, scores: array, complete: bool):
+        self.ids = ids
+        self.scores = scores
+        self.complete = complete
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_ranking(cls, ranked: List[Tuple[int, int]], cap: int = RECOMMENDATIONS_CAP) -> "Recommendations":
+        """Список из результата TagScorer.top_k(..., k=cap)."""
+        return cls(
+            array("q", (user_id for user_id, _ in ranked[:cap])),
+            array("B", (score for _, score in ranked[:cap])),
+            len(ranked) < cap,
+        )
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Recommendations":
+        ids, scores = array("q"), array("B")
+        ids.frombytes(row["ids"])
+        scores.frombytes(row["scores"])
+        return cls(ids, scores, bool(row["complete"]))
+
+    @property
+    def bar(self) -> int:
+        """Минимальное число совпадений, при котором анкета может быть в списке."""
+        return 0 if self.complete or not self.scores else self.scores[-1]
+
+    def to_row(self, user_id: int) -> Tuple:
+        return (
+            user_id,
+            self.ids.tobytes(),
+            self.scores.tobytes(),
+            int(self.complete),
+            self.scores[-1] if self.scores else 0,
+        )
+
+    def apply(self, user_id: int, score: int, cap: int = RECOMMENDATIONS_CAP) -> bool:
+        """Учитывает новое число совпадений анкеты user_id; True, если список изменился."""
+        changed = False
+        if user_id in self.ids:
+            i = self.ids.index(user_id)
+            del self.ids[i]
+            del self.scores[i]
+            changed = True
+        if score <= 0:
+            return changed
+        # Анкета ниже хвоста неполного списка в префикс не попадает.
+        if not self.complete and (
+            not self.ids or (score, -user_id) < (self.scores[-1], -self.ids[-1])
+        ):
+            return changed
+        i = 0
+        while i < len(self.ids) and (self.scores[i], -self.ids[i]) > (score, -user_id):
+            i += 1
+        self.ids.insert(i, user_id)
+        self.scores.insert(i, score)
+        if len(self.ids) > cap:
+            del self.ids[cap:]
+            del self.scores[cap:]
+            self.complete = False
+        return True
+
+    def needs_refill(self, size: int = RECOMMENDATIONS_SIZE) -> bool:
+        return not self.complete and len(self.ids) < size
+
+def init_recommendations(conn: sqlite3.Connection):
+    conn.execute(SQL_CREATE_RECOMMENDATIONS)
+    conn.commit()
+
+def get_recommendations(conn: sqlite3.Connection, user_id: int) -> Optional[Recommendations]:
+    row = conn.execute(SQL_GET_RECOMMENDATIONS, (user_id,)).fetchone()
+    return Recommendations.from_row(row) if row else None
+
+def put_recommendations(conn: sqlite3.Connection, user_id: int, recommendations: Recommendations):
+    with conn:
+        conn.execute(SQL_UPSERT_RECOMMENDATIONS, recommendations.to_row(user_id))
+        log_changes(conn, CHANGE_RECOMMENDATIONS, (user_id,))
+
+def get_recommendation_bars(conn: sqlite3.Connection) -> Dict[int, int]:
+    """Пороги (Recommendations.bar) всех сохранённых списков по владельцам."""
+    return {
+        row["user_id"]: 0 if row["complete"] else row["last_score"]
+        for row in conn.execute(SQL_GET_RECOMMENDATION_BARS)
+    }
+
+def get_many_recommendation_bars(conn: sqlite3.Connection, owners: List[int]) -> Dict[int, int]:
+    """Пороги списков владельцев owners; у кого списка нет, в результат не попадают."""
+    bars = {}
+    for start in range(0, len(owners), _CHUNK):
+        chunk = owners[start:start + _CHUNK]
+        sql = SQL_GET_MANY_RECOMMENDATION_BARS.format(placeholders=", ".join("?" * len(chunk)))
+        for row in conn.execute(sql, chunk):
+            bars[row["user_id"]] = 0 if row["complete"] else row["last_score"]
+    return bars
+
+def apply_profile_change(
+    conn: sqlite3.Connection,
+    user_id: int,
+    owners: List[Tuple[int, int]],
+) -> Tuple[List[int], Dict[int, int]]:
+    """Переносит изменение маски анкеты user_id в сохранённые списки.
+
+    owners — пары (владелец списка, новое число совпадений с анкетой) для
+    списков, в которые анкета входит или может войти. Собственный список
+    user_id удаляется и построится заново при следующем поиске. Возвращает
+    владельцев, которым не хватило позиций и нужен пересчёт, и новые пороги
+    изменённых списков.
+    """
+    refill, bars = [], {}
+    with conn:
+        # Списки читаются и переписываются под блокировкой записи: другой
+        # процесс бота не вклинится между чтением и записью.
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(SQL_DELETE_RECOMMENDATIONS, (user_id,))
+        for start in range(0, len(owners), _CHUNK):
+            chunk = dict(owners[start:start + _CHUNK])
+            sql = SQL_GET_MANY_RECOMMENDATIONS.format(placeholders=", ".join("?" * len(chunk)))
+            updated = []
+            for row in conn.execute(sql, tuple(chunk)).fetchall():
+                owner = row["user_id"]
+                recommendations = Recommendations.from_row(row)
+                if recommendations.apply(user_id, chunk[owner]):
+                    if recommendations.needs_refill():
+                        refill.append(owner)
+                    updated.append(recommendations.to_row(owner))
+                    bars[owner] = recommendations.bar
+            conn.executemany(SQL_UPSERT_RECOMMENDATIONS, updated)
+        log_changes(conn, CHANGE_RECOMMENDATIONS, [user_id, *bars])
+    return refill, bars
+
+def put_many_recommendations(conn: sqlite3.Connection, rows: Iterable[Tuple]):
+    rows = list(rows)
+    with conn:
+        conn.executemany(SQL_UPSERT_RECOMMENDATIONS, rows)
+        log_changes(conn, CHANGE_RECOMMENDATIONS, [row[0] for row in rows])
+
+def clear_recommendations(conn: sqlite3.Connection):
+    """Сбрасывает все списки (после массовой записи в обход add_user)."""
+    with conn:
+        conn.execute(SQL_CLEAR_RECOMMENDATIONS)
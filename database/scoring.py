@@ -0,0 +1,188 @@
+import heapq
+from array import array
+from bisect import bisect_left
+from typing import Iterable, List, Optional, Tuple
+
+from keyboards.keyboards import TAGS
+
+try:
+    import numpy as np
+except ImportError:  # без numpy работает построчный подсчёт на array
+    np = None
+
+# Бит тега в маске определяется его позицией в TAGS, поэтому новые теги
+# можно добавлять только в конец списка.
+TAG_BITS = {tag: 1 << i for i, tag in enumerate(TAGS)}
+MASK_LIMIT = 1 << len(TAGS)
+
+# Таблица popcount для всех возможных масок: подсчёт совпадений сводится
+# к одному обращению по индексу (для numpy — к одной векторной выборке).
+_POPCOUNT = bytes(bin(m).count("1") for m in range(MASK_LIMIT))
+if np is not None:
+    _POPCOUNT_NP = np.frombuffer(_POPCOUNT, dtype=np.uint8)
+    # numpy>=2 считает popcount напрямую, иначе используется таблица.
+    _np_popcount = getattr(np, "bitwise_count", None) or (lambda masks: _POPCOUNT_NP[masks])
+
+def tags_to_mask(tags: Iterable[str]) -> int:
+    """Битовая маска набора тегов; теги не из TAGS игнорируются."""
+    mask = 0
+    for tag in tags:
+        mask |= TAG_BITS.get(tag, 0)
+    return mask
+
+def overlap(mask_a: int, mask_b: int) -> int:
+    """Число общих тегов двух масок."""
+    return _POPCOUNT[mask_a & mask_b]
+
+def mask_to_tags(mask: int) -> List[str]:
+    """Список тегов маски в порядке TAGS."""
+    return [tag for tag, bit in TAG_BITS.items() if mask & bit]
+
+class TagScorer:
+    """Масочный индекс анкет в памяти для ранжирования по числу общих тегов.
+
+    Маски и user_id хранятся в двух непрерывных массивах, упорядоченных по
+    user_id, поэтому при равном числе совпадений порядок совпадает с SQL.
+    """
+
+    def __init__(self):
+        self._ids = array("q")
+        self._masks = array("I")
+        # Эпоха данных растёт при каждом изменении индекса; по ней кэши
+        # результатов понимают, что ранжирование устарело.
+        self.epoch = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def load(self, rows: Iterable[Tuple[int, int]]):
+        """Заменяет содержимое индекса парами (user_id, tag_mask)."""
+        pairs = sorted({int(user_id): int(mask or 0) for user_id, mask in rows}.items())
+        self._ids = array("q", (user_id for user_id, _ in pairs))
+        self._masks = array("I", (mask for _, mask in pairs))
+        self.epoch += 1
+
+    def _slot(self, user_id: int) -> Optional[int]:
+        i = bisect_left(self._ids, user_id)
+        if i < len(self._ids) and self._ids[i] == user_id:
+            return i
+        return None
+
+    def mask_of(self, user_id: int) -> Optional[int]:
+        """Маска анкеты или None, если анкеты нет в индексе."""
+        i = self._slot(user_id)
+        return self._masks[i] if i is not None else None
+
+    def upsert(self, user_id: int, mask: int):
+        """Добавляет или обновляет маску анкеты."""
+        self.epoch += 1
+        i = bisect_left(self._ids, user_id)
+        if i < len(self._ids) and self._ids[i] == user_id:
+            self._masks[i] = mask
+        else:
+            self._ids.insert(i, user_id)
+            self._masks.insert(i, mask)
+
+    def remove(self, user_id: int):
+        """Удаляет анкету из индекса."""
+        i = self._slot(user_id)
+        if i is not None:
+            self.epoch += 1
+            del self._ids[i]
+            del self._masks[i]
+
+    def sharing(self, query_mask: int) -> List[Tuple[int, int]]:
+        """Пары (user_id, маска) анкет хотя бы с одним тегом из query_mask."""
+        if not query_mask:
+            return []
+        if np is not None:
+            masks = np.frombuffer(self._masks, dtype=np.uint32)
+            ids = np.frombuffer(self._ids, dtype=np.int64)
+            idx = np.flatnonzero(masks & np.uint32(query_mask))
+            pairs = list(zip(ids[idx].tolist(), masks[idx].tolist()))
+            del masks, ids  # освобождаем буферы array до возможной вставки
+            return pairs
+        return [(u, m) for u, m in zip(self._ids, self._masks) if m & query_mask]
+
+    def top_k(
+        self,
+        query_mask: int,
+        k: Optional[int] = None,
+        exclude_user_id: Optional[int] = None,
+        only_matching: bool = True,
+    ) -> List[Tuple[int, int]]:
+        """Пары (user_id, число совпавших тегов) по убыванию совпадений.
+
+        При only_matching=True анкеты без совпадений отбрасываются.
+        """
+        if not self._ids or (only_matching and not query_mask):
+            return []
+        excluded = self._slot(exclude_user_id) if exclude_user_id is not None else None
+        min_score = 1 if only_matching else 0
+        if np is not None:
+            slots, scores = self._top_k_numpy(query_mask, k, excluded, min_score)
+        else:
+            slots, scores = self._top_k_python(query_mask, k, excluded, min_score)
+        return [(self._ids[i], s) for i, s in zip(slots, scores)]
+
+    def count(
+        self,
+        query_mask: int,
+        exclude_user_id: Optional[int] = None,
+        only_matching: bool = True,
+    ) -> int:
+        """Число анкет, которые вернул бы top_k без ограничения k."""
+        if only_matching and not query_mask:
+            return 0
+        excluded = self._slot(exclude_user_id) if exclude_user_id is not None else None
+        if only_matching:
+            if np is not None:
+                masks = np.frombuffer(self._masks, dtype=np.uint32)
+                total = int(np.count_nonzero(masks & np.uint32(query_mask)))
+                del masks
+            else:
+                total = sum(1 for m in self._masks if m & query_mask)
+            if excluded is not None and self._masks[excluded] & query_mask:
+                total -= 1
+            return total
+        return len(self._ids) - (excluded is not None)
+
+    def _top_k_numpy(self, query_mask, k, excluded, min_score):
+        masks = np.frombuffer(self._masks, dtype=np.uint32)
+        scores = _np_popcount(masks & np.uint32(query_mask))
+        del masks  # освобождаем буфер array до возможной вставки
+        # Исключённая анкета отбрасывается после отбора, поэтому берём на одну больше.
+        wanted = None if k is None else k + (excluded is not None)
+        if wanted is None or wanted >= len(scores):
+            idx = np.flatnonzero(scores >= min_score)
+        else:
+            # Порог — k-е по величине число совпадений, считается по гистограмме:
+            # всё, что выше, входит целиком, из равных порогу — первые по user_id.
+            counts = np.bincount(scores, minlength=len(TAGS) + 1)
+            threshold, taken = len(counts) - 1, 0
+            while threshold > min_score and taken + counts[threshold] < wanted:
+                taken += counts[threshold]
+                threshold -= 1
+            above = np.flatnonzero(scores > threshold)
+            equal = np.flatnonzero(scores == threshold)[:max(wanted - len(above), 0)]
+            idx = np.concatenate((above, equal))
+        if excluded is not None:
+            idx = idx[idx != excluded]
+        idx = idx[np.argsort(-scores[idx].astype(np.int8), kind="stable")]
+        if k is not None:
+            idx = idx[:k]
+        return idx.tolist(), scores[idx].tolist()
+
+    def _top_k_python(self, query_mask, k, excluded, min_score):
+        scores = [_POPCOUNT[m & query_mask] for m in self._masks]
+        if excluded is not None:
+            scores[excluded] = -1
+        candidates = [i for i, s in enumerate(scores) if s >= min_score]
+        key = lambda i: (-scores[i], i)
+        if k is None or k >= len(candidates):
+            candidates.sort(key=key)
+        else:
+            candidates = heapq.nsmallest(k, candidates, key=key)
+        return candidates, [scores[i] for i in candidates]
+
+scorer = TagScorer()
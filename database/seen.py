@@ -0,0 +1,218 @@
+import asyncio
+import sqlite3
+from collections import OrderedDict
+from sqlite3 import Error
+from typing import Dict, Optional, Tuple
+
+# Фильтр Блума на SEEN_CAPACITY анкет с ~1% ложных срабатываний:
+# SEEN_BITS бит (1200 байт) и SEEN_HASHES хеш-функций на анкету.
+SEEN_CAPACITY = 1000
+SEEN_BITS = 9600
+SEEN_HASHES = 7
+
+SQL_CREATE_SEEN = '''
+    CREATE TABLE IF NOT EXISTS seen_profiles (
+        user_id INTEGER PRIMARY KEY,
+        previous BLOB NOT NULL,
+        previous_count INTEGER NOT NULL,
+        current BLOB NOT NULL,
+        current_count INTEGER NOT NULL
+    )
+'''
+SQL_GET_SEEN = "SELECT * FROM seen_profiles WHERE user_id = ?"
+SQL_UPSERT_SEEN = '''
+    INSERT OR REPLACE INTO seen_profiles (user_id, previous, previous_count, current, current_count)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+_MASK64 = (1 << 64) - 1
+
+def _positions(user_id: int):
+    """Номера бит анкеты: двойное хеширование от одного splitmix64."""
+    x = (user_id + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    x ^= x >> 31
+    h1, h2 = x & 0xFFFFFFFF, (x >> 32) | 1
+    return [(h1 + i * h2) % SEEN_BITS for i in range(SEEN_HASHES)]
+
+class BloomFilter:
+    """Фильтр Блума по user_id; count — оценка числа добавленных анкет сверху."""
+
+    __slots__ = ("bits", "count")
+
+    def __init__(self, bits: Optional[bytes] = None, count: int = 0):
+        self.bits = bytearray(bits) if bits else bytearray(SEEN_BITS // 8)
+        self.count = count
+
+    def __contains__(self, user_id: int) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in _positions(user_id))
+
+    def add(self, user_id: int) -> bool:
+        """Добавляет анкету; False, если она уже (вероятно) была в фильтре."""
+        added = False
+        bits = self.bits
+        for p in _positions(user_id):
+            bit = 1 << (p & 7)
+            if not bits[p >> 3] & bit:
+                bits[p >> 3] |= bit
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def union(self, other: "BloomFilter") -> "BloomFilter":
+        merged = int.from_bytes(self.bits, "little") | int.from_bytes(other.bits, "little")
+        return BloomFilter(merged.to_bytes(len(self.bits), "little"), self.count + other.count)
+
+class SeenProfiles:
+    """Просмотренные пользователем анкеты.
+
+    previous — анкеты прошлых поисков, они пропускаются в выдаче; current —
+    анкеты текущего поиска, по ним можно листать назад. При начале нового
+    поиска current вливается в previous; когда previous переполняется,
+    старая история забывается.
+    """
+
+    __slots__ = ("previous", "current")
+
+    def __init__(self, previous: Optional[BloomFilter] = None, current: Optional[BloomFilter] = None):
+        self.previous = previous or BloomFilter()
+        self.current = current or BloomFilter()
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "SeenProfiles":
+        return cls(
+            BloomFilter(row["previous"], row["previous_count"]),
+            BloomFilter(row["current"], row["current_count"]),
+        )
+
+    def to_row(self, user_id: int) -> Tuple:
+        return (
+            user_id,
+            bytes(self.previous.bits), self.previous.count,
+            bytes(self.current.bits), self.current.count,
+        )
+
+    def seen(self, user_id: int) -> bool:
+        """Была ли анкета показана в одном из прошлых поисков."""
+        return user_id in self.previous
+
+    def mark(self, user_id: int) -> bool:
+        return self.current.add(user_id)
+
+    def start_session(self) -> bool:
+        """Переносит анкеты текущего поиска в прошлые; True, если что-то изменилось."""
+        if not self.current.count:
+            return False
+        if self.previous.count + self.current.count <= SEEN_CAPACITY:
+            self.previous = self.previous.union(self.current)
+        elif self.current.count <= SEEN_CAPACITY:
+            self.previous = self.current
+        else:
+            self.previous = BloomFilter()
+        self.current = BloomFilter()
+        return True
+
+def init_seen(conn: sqlite3.Connection):
+    conn.execute(SQL_CREATE_SEEN)
+    conn.commit()
+
+def _get_seen(conn: sqlite3.Connection, user_id: int):
+    return conn.execute(SQL_GET_SEEN, (user_id,)).fetchone()
+
+def _put_seen(conn: sqlite3.Connection, rows):
+    with conn:
+        conn.executemany(SQL_UPSERT_SEEN, rows)
+
+class SeenStore:
+    """Просмотренные анкеты активных пользователей с отложенной записью.
+
+    Фильтры последних maxsize пользователей держатся в памяти; изменения
+    пишутся в базу одной транзакцией раз в flush_interval секунд.
+    Несброшенные фильтры из памяти не вытесняются.
+    """
+
+    def __init__(self, pool, maxsize: int = 2000, flush_interval: float = 1.0):
+        self.maxsize = maxsize
+        self.flush_interval = flush_interval
+        self._pool = pool
+        self._entries: "OrderedDict[int, SeenProfiles]" = OrderedDict()
+        self._dirty = set()
+        self._flusher: Optional[asyncio.Task] = None
+        self.flushes = 0
+
+    def attach(self, pool):
+        """Подключение к пулу базы; фильтры другой базы забываются."""
+        if pool is not self._pool:
+            self._entries.clear()
+            self._dirty.clear()
+        self._pool = pool
+
+    async def get(self, user_id: int) -> SeenProfiles:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self._entries.move_to_end(user_id)
+            return entry
+        try:
+            row = await self._pool.run(_get_seen, user_id)
+        except Error as e:
+            print(f"Ошибка при чтении просмотренных анкет: {e}")
+            row = None
+        loaded = SeenProfiles.from_row(row) if row else SeenProfiles()
+        # Пока шло чтение, фильтр мог загрузить параллельный вызов.
+        entry = self._entries.setdefault(user_id, loaded)
+        self._evict()
+        return entry
+
+    def touch(self, user_id: int):
+        """Отмечает фильтр пользователя изменённым и планирует запись."""
+        self._dirty.add(user_id)
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    def _evict(self):
+        excess = len(self._entries) - self.maxsize
+        if excess <= 0:
+            return
+        for user_id in list(self._entries):
+            if excess <= 0:
+                break
+            if user_id not in self._dirty:
+                del self._entries[user_id]
+                excess -= 1
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.flush_interval)
+        finally:
+            self._flusher = None
+        await self.flush()
+
+    async def flush(self):
+        """Записывает изменённые фильтры одной транзакцией."""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        rows = [self._entries[user_id].to_row(user_id) for user_id in dirty if user_id in self._entries]
+        try:
+            await self._pool.run(_put_seen, rows)
+            self.flushes += 1
+        except Error as e:
+            print(f"Ошибка при записи просмотренных анкет: {e}")
+            self._dirty |= dirty
+        self._evict()
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "pending": len(self._dirty), "flushes": self.flushes}
@@ -0,0 +1,249 @@
+import asyncio
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from database.cache import MISSING
+from database.models import Profile
+
+class _Strings:
+    """Колонка строк: все значения подряд в UTF-8 и массив смещений.
+
+    Пустая строка хранится как None (фото и описание необязательны).
+    """
+
+    __slots__ = ("data", "offsets")
+
+    def __init__(self, data: bytes = b"", offsets: Optional[array] = None):
+        self.data = data
+        self.offsets = offsets if offsets is not None else array("Q", [0])
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.data[start:end].decode() if end > start else None
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data) + self.offsets.itemsize * len(self.offsets)
+
+class _StringsBuilder:
+    __slots__ = ("data", "offsets")
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array("Q", [0])
+
+    def append(self, value: Optional[str]):
+        if value:
+            self.data += value.encode()
+        self.offsets.append(len(self.data))
+
+    def extend(self, column: _Strings, start: int, end: int):
+        """Копирует значения [start, end) другой колонки одним куском."""
+        if start >= end:
+            return
+        base, first = len(self.data), column.offsets[start]
+        self.data += column.data[first:column.offsets[end]]
+        shift = base - first
+        tail = column.offsets[start + 1:end + 1]
+        self.offsets.extend(tail if not shift else array("Q", (o + shift for o in tail)))
+
+    def build(self) -> _Strings:
+        return _Strings(bytes(self.data), self.offsets)
+
+class ProfileSnapshot:
+    """Неизменяемая колоночная копия таблицы users, упорядоченная по user_id.
+
+    Изменения не вносятся на месте: merge собирает новый снимок, копируя
+    неизменённые участки колонок целиком.
+    """
+
+    __slots__ = ("ids", "masks", "courses", "course_names", "usernames", "photo_ids", "skills", "version")
+
+    def __init__(self, ids, masks, courses, course_names, usernames, photo_ids, skills, version=0):
+        self.ids = ids
+        self.masks = masks
+        self.courses = courses
+        self.course_names = course_names
+        self.usernames = usernames
+        self.photo_ids = photo_ids
+        self.skills = skills
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple]) -> "ProfileSnapshot":
+        """Снимок из строк (user_id, username, course, photo_id, skills, tag_mask) по возрастанию user_id."""
+        builder = _Builder(())
+        for row in rows:
+            builder.append(*row)
+        return builder.build(0)
+
+    def _slot(self, user_id: int) -> Optional[int]:
+        i = bisect_left(self.ids, user_id)
+        if i < len(self.ids) and self.ids[i] == user_id:
+            return i
+        return None
+
+    def get(self, user_id: int) -> Optional[Profile]:
+        """Анкета или None."""
+        i = self._slot(user_id)
+        if i is None:
+            return None
+        return Profile(
+            user_id,
+            self.usernames[i],
+            self.course_names[self.courses[i]],
+            self.photo_ids[i],
+            self.skills[i],
+            self.masks[i],
+        )
+
+    def merge(self, changes: List[Tuple[int, Optional[Profile]]]) -> "ProfileSnapshot":
+        """Новый снимок с изменениями (user_id, анкета или None для удаления)."""
+        builder = _Builder(self.course_names)
+        pos = 0
+        for user_id, profile in sorted(changes, key=lambda change: change[0]):
+            i = bisect_left(self.ids, user_id, pos)
+            builder.extend(self, pos, i)
+            pos = i + 1 if i < len(self.ids) and self.ids[i] == user_id else i
+            if profile is not None:
+                builder.append(
+                    user_id, profile.username, profile.course,
+                    profile.photo_id, profile.skills, profile.tag_mask,
+                )
+        builder.extend(self, pos, len(self.ids))
+        return builder.build(self.version + 1)
+
+    @property
+    def nbytes(self) -> int:
+        """Примерный объём колонок в байтах."""
+        return (
+            self.ids.itemsize * len(self.ids) + self.masks.itemsize * len(self.masks)
+            + self.courses.itemsize * len(self.courses)
+            + self.usernames.nbytes + self.photo_ids.nbytes + self.skills.nbytes
+        )
+
+class _Builder:
+    def __init__(self, course_names: Tuple[str, ...]):
+        self.ids = array("q")
+        self.masks = array("I")
+        self.courses = array("H")
+        self.course_names = list(course_names)
+        self._course_codes = {name: code for code, name in enumerate(course_names)}
+        self.usernames = _StringsBuilder()
+        self.photo_ids = _StringsBuilder()
+        self.skills = _StringsBuilder()
+
+    def _course_code(self, course: str) -> int:
+        code = self._course_codes.get(course)
+        if code is None:
+            code = self._course_codes[course] = len(self.course_names)
+            self.course_names.append(course)
+        return code
+
+    def append(self, user_id, username, course, photo_id, skills, tag_mask):
+        self.ids.append(user_id)
+        self.masks.append(tag_mask or 0)
+        self.courses.append(self._course_code(course))
+        self.usernames.append(username)
+        self.photo_ids.append(photo_id)
+        self.skills.append(skills)
+
+    def extend(self, snapshot: ProfileSnapshot, start: int, end: int):
+        # Коды курсов совпадают: новый снимок начинается со списка курсов старого.
+        self.ids.extend(snapshot.ids[start:end])
+        self.masks.extend(snapshot.masks[start:end])
+        self.courses.extend(snapshot.courses[start:end])
+        self.usernames.extend(snapshot.usernames, start, end)
+        self.photo_ids.extend(snapshot.photo_ids, start, end)
+        self.skills.extend(snapshot.skills, start, end)
+
+    def build(self, version: int) -> ProfileSnapshot:
+        return ProfileSnapshot(
+            self.ids, self.masks, self.courses, tuple(self.course_names),
+            self.usernames.build(), self.photo_ids.build(), self.skills.build(), version,
+        )
+
+class SnapshotStore:
+    """Снимок анкет для чтения и очередь ещё не влитых в него записей.
+
+    Читатели берут текущую ссылку на снимок без блокировок. Записи сразу
+    видны через overlay, а в снимок попадают фоновой пересборкой не позже
+    чем через staleness секунд после первой невлитой записи.
+    """
+
+    def __init__(self, staleness: float = 1.0):
+        self.staleness = staleness
+        self.current: Optional[ProfileSnapshot] = None
+        self._overlay: Dict[int, Optional[Profile]] = {}
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self.rebuilds = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.current is not None
+
+    def load(self, snapshot: ProfileSnapshot):
+        self.current = snapshot
+        self._overlay.clear()
+
+    def get(self, user_id: int) -> Any:
+        """Анкета, None если её нет, или MISSING, если снимок не загружен."""
+        snapshot = self.current
+        if snapshot is None:
+            return MISSING
+        if user_id in self._overlay:
+            return self._overlay[user_id]
+        return snapshot.get(user_id)
+
+    def record(self, user_id: int, profile: Optional[Profile]):
+        """Учитывает запись анкеты (None — удаление) и планирует пересборку."""
+        if self.current is None:
+            return
+        self._overlay[user_id] = profile
+        if self._rebuild_task is None:
+            self._rebuild_task = asyncio.create_task(self._rebuild())
+
+    async def _rebuild(self):
+        try:
+            await asyncio.sleep(self.staleness)
+            snapshot = self.current
+            changes = list(self._overlay.items())
+            merged = await asyncio.get_running_loop().run_in_executor(None, snapshot.merge, changes)
+            if self.current is snapshot:
+                self.current = merged
+                self.rebuilds += 1
+                # Записи, пришедшие во время сборки, остаются до следующей.
+                for user_id, profile in changes:
+                    if self._overlay.get(user_id, MISSING) is profile:
+                        del self._overlay[user_id]
+        except Exception as e:
+            print(f"Ошибка при пересборке снимка анкет: {e}")
+        self._rebuild_task = None
+        if self._overlay and self.current is not None:
+            self._rebuild_task = asyncio.create_task(self._rebuild())
+
+    async def close(self):
+        self.current = None
+        if self._rebuild_task is not None:
+            self._rebuild_task.cancel()
+            try:
+                await self._rebuild_task
+            except asyncio.CancelledError:
+                pass
+            self._rebuild_task = None
+        self._overlay.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Размер снимка, число невлитых записей и пересборок."""
+        snapshot = self.current
+        return {
+            "size": len(snapshot) if snapshot is not None else 0,
+            "bytes": snapshot.nbytes if snapshot is not None else 0,
+            "version": snapshot.version if snapshot is not None else 0,
+            "pending": len(self._overlay),
+            "rebuilds": self.rebuilds,
+        }
@@ -0,0 +1,108 @@
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+
+class WriteQueue:
+    """Групповая запись анкет.
+
+    Изменения (кортеж user_row или None для удаления) пишутся одной
+    транзакцией функцией apply(conn, rows, deleted_ids). Первое изменение
+    после простоя пишется сразу; пока идёт запись, следующие копятся и
+    уходят следующим пакетом, который ещё до max_delay секунд ждёт
+    попутчиков (но не больше max_batch изменений). Вызывающий получает future,
+    который завершается после коммита транзакции с его изменением (или с
+    её ошибкой; если пакет не записался, анкеты пишутся по одной и ошибку
+    получают только изменения сбойной анкеты). Из нескольких изменений одной анкеты в пакете пишется
+    последнее. Результат apply передаётся в on_applied в цикле событий.
+    """
+
+    def __init__(
+        self,
+        pool,
+        apply: Callable,
+        max_delay: float = 0.005,
+        max_batch: int = 500,
+        on_applied: Optional[Callable] = None,
+    ):
+        self._pool = pool
+        self._apply = apply
+        self._on_applied = on_applied
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._pending: List[Tuple[int, Optional[tuple], asyncio.Future]] = []
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.writes = 0
+        self.largest_batch = 0
+
+    def attach(self, pool):
+        self._pool = pool
+
+    def submit(self, user_id: int, row: Optional[tuple]) -> asyncio.Future:
+        """Ставит запись анкеты (row=None — удаление) в очередь."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((user_id, row, future))
+        if self._task is None:
+            self._full = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        return future
+
+    async def _run(self):
+        busy = False
+        try:
+            while self._pending:
+                if busy and len(self._pending) < self.max_batch:
+                    try:
+                        await asyncio.wait_for(self._full.wait(), self.max_delay)
+                    except asyncio.TimeoutError:
+                        pass
+                self._full.clear()
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                await self._write(batch)
+                busy = True
+        finally:
+            self._task = None
+
+    async def _write(self, batch):
+        latest: Dict[int, Optional[tuple]] = {}
+        for user_id, row, _ in batch:
+            latest[user_id] = row
+        rows = [row for row in latest.values() if row is not None]
+        deleted = [user_id for user_id, row in latest.items() if row is None]
+        try:
+            result = await self._pool.run(self._apply, rows, deleted)
+        except Exception as e:
+            if len(latest) > 1:
+                # Ошибка одной анкеты откатывает весь пакет: пишем анкеты по
+                # одной, чтобы ошибку получили только изменения этой анкеты.
+                for user_id in latest:
+                    await self._write([item for item in batch if item[0] == user_id])
+                return
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.writes += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        if self._on_applied is not None:
+            self._on_applied(result)
+        for _, _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    async def close(self):
+        """Дожидается записи всех поставленных изменений."""
+        if self._task is not None:
+            await self._task
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "writes": self.writes,
+            "largest_batch": self.largest_batch,
+        }
@@ -2,12 +2,23 @@ from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database.db import add_user, get_user, delete_user, get_all_users
+from database.db import (
+    add_user, get_user, delete_user, get_ranked_page, count_ranked_users, get_recommended_page,
+    search_by_text, count_text_matches, start_seen_session, get_seen, mark_seen, set_subscription,
+    tag_counts, has_tag_matches, profile_card
+)
+from database.cards import ProfileCard, format_tags
+from database.models import Profile
+from database.seen import SeenProfiles
+from database.scoring import tags_to_mask
 from keyboards.keyboards import get_course_keyboard, get_confirm_keyboard, get_navigation_keyboard, get_tags_keyboard, get_commands_menu_keyboard, TAGS
 from typing import Union, Set, List
 
 router = Router()
 
+# Ключи состояния поиска: хранилище удаляет их после простоя (app.main --search-ttl).
+SEARCH_STATE_PREFIXES = ("search_", "find_text")
+
 class ProfileCreation(StatesGroup):
     awaiting_photo = State()
     awaiting_skills = State()
@@ -16,15 +27,9 @@ class ProfileCreation(StatesGroup):
 class FindUsers(StatesGroup):
     awaiting_tags = State()
 
-def _parse_tags_str(tags_str: Union[str, None]) -> Set[str]:
-    if not tags_str:
-        return set()
-    return {t.strip() for t in tags_str.split(",") if t.strip()}
-
-def _format_tags(tags: Union[Set[str], List[str], None]) -> str:
-    if not tags:
-        return "Не указаны"
-    return ", ".join(sorted(tags))
+def _find_tags_keyboard(selected: Union[Set[str], List[str]]):
+    """Клавиатура навыков /find с числом анкет у каждого навыка."""
+    return get_tags_keyboard(list(selected), confirm_text="🔎 Найти", confirm_callback="find_confirm", counts=tag_counts())
 
 # --------------------- КОМАНДЫ ---------------------
 @router.message(F.text == "/start")
@@ -42,6 +47,9 @@ async def help_command(message: Message):
         "/start - Начать работу с ботом\n"
         "/profile - Просмотреть или отредактировать анкету\n"
         "/search - Просмотреть анкеты других пользователей\n"
+        "/find <текст> - Найти пользователей по описанию анкеты\n"
+        "/subscribe - Получать уведомления о новых анкетах с вашими навыками\n"
+        "/unsubscribe - Отключить уведомления\n"
         "/delete_profile - Удалить свою анкету\n"
         "/help - Показать эту справку"
     )
@@ -51,17 +59,12 @@ async def help_command(message: Message):
 async def profile_command(message: Message):
     """Обработчик команды /profile."""
     user_id = message.from_user.id
-    user_data = get_user(user_id)
+    user_data = await get_user(user_id)
 
     if user_data:
-        text = (
-            f"📌 Ваша анкета:\n"
-            f"👤 @{user_data[1]}\n"
-            f"📚 Курс: {user_data[2]}\n"
-            f"🛠 Навыки: {user_data[4] or 'Не указаны'}\n"
-        )
-        if user_data[3]:  # photo_id
-            await message.answer_photo(user_data[3], caption=text, reply_markup=get_confirm_keyboard())
+        text = profile_card(user_data).own_text()
+        if user_data.photo_id:
+            await message.answer_photo(user_data.photo_id, caption=text, reply_markup=get_confirm_keyboard())
         else:
             await message.answer(text, reply_markup=get_confirm_keyboard())
     else:
@@ -71,33 +74,57 @@ async def profile_command(message: Message):
 async def delete_profile_command(message: Message):
     """Обработчик команды /delete_profile."""
     user_id = message.from_user.id
-    delete_user(user_id)
+    await delete_user(user_id)
     await message.answer("Ваша анкета удалена.")
 
 @router.message(F.text == "/search")
 async def search_command(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    me = get_user(user_id)
-    my_tags = _parse_tags_str(me['tags'] if me else None)
+    me = await get_user(user_id)
+    my_mask = me.tag_mask if me else 0
+    await _start_search(state, my_mask, user_id, only_matching=False, recommended=True)
+    await show_user_profile(message, state, 0)
 
-    users = get_all_users(user_id)
-    if not users:
-        await message.answer("Анкеты закончились. Попробуйте позже!")
+@router.message(F.text == "/subscribe")
+async def subscribe_command(message: Message):
+    """Подписка на уведомления о новых анкетах с общими навыками."""
+    user_id = message.from_user.id
+    me = await get_user(user_id)
+    if not me or not me.tag_mask:
+        await message.answer("Уведомления приходят по навыкам вашей анкеты. Сначала создайте анкету с навыками: /start")
         return
+    await set_subscription(user_id, True)
+    await message.answer(
+        f"🔔 Вы подписаны: пришлём новые анкеты с навыками {format_tags(me.tags)}.\n"
+        "Отключить: /unsubscribe"
+    )
 
-    users_sorted = sorted(users, key=lambda u: len(my_tags & _parse_tags_str(u['tags'])), reverse=True)
-    await state.update_data(search_users=users_sorted, search_index=0, my_tags=list(my_tags))
-    await show_user_profile(message, state, 0)
+@router.message(F.text == "/unsubscribe")
+async def unsubscribe_command(message: Message):
+    await set_subscription(message.from_user.id, False)
+    await message.answer("🔕 Уведомления о новых анкетах отключены.")
 
 @router.message(F.text == "/find")
 async def find_command(message: Message, state: FSMContext):
-    await state.update_data(selected_tags=[])
+    await state.update_data(selected_tags=[], find_text=None)
     await message.answer(
     "🧭 Выберите навыки для поиска:",
-    reply_markup=get_tags_keyboard([], confirm_text="🔎 Найти", confirm_callback="find_confirm")
+    reply_markup=_find_tags_keyboard([])
 )
     await state.set_state(FindUsers.awaiting_tags)
 
+@router.message(F.text.startswith("/find "))
+async def find_text_command(message: Message, state: FSMContext):
+    """Поиск по описанию анкет; теги можно выбрать дополнительно для фильтра."""
+    find_text = message.text[len("/find "):].strip()[:200]
+    await state.update_data(selected_tags=[], find_text=find_text)
+    await message.answer(
+        f"🔍 Поиск по описанию: «{find_text}»\n"
+        "🧭 Выберите навыки, чтобы уточнить поиск, или сразу нажмите «Найти»:",
+        reply_markup=_find_tags_keyboard([])
+    )
+    await state.set_state(FindUsers.awaiting_tags)
+
 @router.message(F.text == "/menu")
 async def menu_command(message: Message):
     """Обработчик команды /menu для отображения списка команд."""
@@ -107,39 +134,130 @@ async def menu_command(message: Message):
 )
 
 # --------------------- ПОКАЗ АНКЕТ ---------------------
+# Анкеты, показанные в прошлых поисках, пропускаются; выдача
+# просматривается кусками от SEEN_SCAN_CHUNK позиций (каждый следующий
+# вдвое больше, до SEEN_SCAN_MAX_CHUNK), но не дальше SEEN_SCAN_LIMIT
+# позиций за одно нажатие.
+SEEN_SCAN_CHUNK = 16
+SEEN_SCAN_MAX_CHUNK = 256
+SEEN_SCAN_LIMIT = 2000
+
+async def _start_search(
+    state: FSMContext,
+    query_mask: int,
+    exclude_user_id: int,
+    only_matching: bool,
+    text: Union[str, None] = None,
+    recommended: bool = False
+):
+    """Сохраняет в состоянии только параметры запроса; анкеты подгружаются по позиции.
+
+    recommended=True — выдача /search: начало читается из сохранённого
+    списка рекомендаций ищущего.
+    """
+    await start_seen_session(exclude_user_id)
+    await state.update_data(
+        search_mask=query_mask,
+        search_exclude=exclude_user_id,
+        search_only_matching=only_matching,
+        search_text=text,
+        search_recommended=recommended,
+        search_skip_seen=True,
+        search_index=0,
+        search_first=None,
+    )
+
+async def _search_page(data: dict, offset: int, limit: int) -> List[Profile]:
+    """Анкеты на позициях [offset, offset + limit) выдачи, сохранённой в состоянии."""
+    query_mask = data.get("search_mask", 0)
+    exclude_user_id = data.get("search_exclude")
+    search_text = data.get("search_text")
+    if search_text:
+        return await search_by_text(search_text, query_mask, exclude_user_id, offset, limit)
+    if data.get("search_recommended"):
+        return await get_recommended_page(exclude_user_id, query_mask, offset, limit)
+    return await get_ranked_page(query_mask, exclude_user_id, offset, limit, data.get("search_only_matching", True))
+
+async def _find_unseen(data: dict, seen: Union[SeenProfiles, None], index: int, step: int, lookahead: bool = True):
+    """Ближайшая к index в направлении step (1 или -1) анкета не из прошлых поисков.
+
+    Возвращает (позиция, анкета, есть ли анкеты дальше) или (None, None, False).
+    «Дальше» тоже считаются только непропускаемые анкеты, чтобы кнопка
+    «Вперёд» не вела в пустоту. При seen=None анкеты не пропускаются;
+    при lookahead=False анкеты дальше не ищутся.
+    """
+    chunk = SEEN_SCAN_CHUNK if seen is not None else 1
+    scanned = 0
+    while index >= 0 and scanned < SEEN_SCAN_LIMIT:
+        if step > 0:
+            # Лишняя анкета в запросе показывает, есть ли что-то дальше.
+            users = await _search_page(data, index, chunk + 1)
+            for offset, user in enumerate(users[:chunk]):
+                if seen is None or not seen.seen(user.user_id):
+                    position = index + offset
+                    rest = users[offset + 1:]
+                    if seen is None or not lookahead or any(not seen.seen(u.user_id) for u in rest):
+                        return position, user, bool(rest)
+                    if len(users) <= chunk:
+                        return position, user, False
+                    # Ищем следующую анкету так же, как её будет искать «Вперёд».
+                    _, following, _ = await _find_unseen(data, seen, position + 1, 1, lookahead=False)
+                    return position, user, following is not None
+            if len(users) <= chunk:
+                break
+            index += chunk
+        else:
+            start = max(0, index - chunk + 1)
+            users = await _search_page(data, start, index - start + 1)
+            for position, user in reversed(list(enumerate(users, start))):
+                if seen is None or not seen.seen(user.user_id):
+                    return position, user, True
+            if start == 0:
+                break
+            index = start - 1
+        scanned += chunk
+        chunk = min(chunk * 2, SEEN_SCAN_MAX_CHUNK)
+    return None, None, False
+
 async def show_user_profile(
     message: Union[Message, CallbackQuery],
     state: FSMContext,
-    index: int
+    index: int,
+    step: int = 1
 ):
     data = await state.get_data()
-    users = data.get("search_users", [])
-    if not users or index < 0 or index >= len(users):
+    query_mask = data.get("search_mask", 0)
+    viewer_id = data.get("search_exclude")
+    skip_seen = data.get("search_skip_seen", False)
+    first = data.get("search_first")
+    notice = ""
+    user = None
+    if "search_mask" in data and index >= 0:
+        seen = await get_seen(viewer_id) if skip_seen else None
+        position, user, has_next = await _find_unseen(data, seen, index, step)
+        if user is None and skip_seen and first is None:
+            # Все анкеты выдачи уже показывались раньше: листаем их заново.
+            position, user, has_next = await _find_unseen(data, None, index, step)
+            skip_seen = False
+            notice = "🔁 Новых анкет нет, показываем уже просмотренные.\n\n"
+    if user is None:
         if isinstance(message, CallbackQuery):
             await message.message.edit_text("Анкеты закончились. Попробуйте позже!")
         else:
             await message.answer("Анкеты закончились. Попробуйте позже!")
         return
 
-    current_user_tags = set(data.get("my_tags", []))
-    user = users[index]
-    their_tags = _parse_tags_str(user['tags'])
-    matched = current_user_tags & their_tags
+    if first is None:
+        first = position
+    await state.update_data(search_index=position, search_first=first, search_skip_seen=skip_seen)
+    await mark_seen(viewer_id, user.user_id)
+    text = notice + profile_card(user).text(query_mask)
 
-    text = (
-        f"👤 @{user['username']}\n"
-        f"📚 Курс: {user['course']}\n"
-        f"🛠 Навыки: {_format_tags(their_tags)}\n"
-    )
-    if matched:
-        text += f"✨ Совпавшие навыки: {_format_tags(matched)}\n"
-    text += f"📝 Описание: {user['skills'] or 'Не указано'}\n"
-
-    keyboard = get_navigation_keyboard(index, len(users))
+    keyboard = get_navigation_keyboard(position, position + 1 + has_next, first)
 
     if isinstance(message, CallbackQuery):
         # Подмена сообщения
-        if user['photo_id']:
+        if user.photo_id:
             await message.message.edit_caption(
                 caption=text,
                 reply_markup=keyboard
@@ -151,9 +269,9 @@ async def show_user_profile(
             )
     else:
         # Просто новый ответ
-        if user['photo_id']:
+        if user.photo_id:
             await message.answer_photo(
-                user['photo_id'],
+                user.photo_id,
                 caption=text,
                 reply_markup=keyboard
             )
@@ -182,7 +300,7 @@ async def handle_course(callback: CallbackQuery, state: FSMContext, bot: Bot):
 @router.callback_query(F.data == "confirm_profile")
 async def confirm_profile(callback: CallbackQuery, state: FSMContext):
     data_state = await state.get_data()
-    add_user(
+    saved = await add_user(
         data_state["user_id"],
         data_state["username"],
         data_state.get("course"),
@@ -190,6 +308,9 @@ async def confirm_profile(callback: CallbackQuery, state: FSMContext):
         data_state.get("skills"),
         data_state.get("tags")
     )
+    if not saved:
+        await callback.answer("⚠️ Не удалось сохранить анкету, попробуйте ещё раз.", show_alert=True)
+        return
     await callback.message.edit_text(
     "✅ Анкета сохранена! Используйте /search для просмотра других анкет."
     )
@@ -203,9 +324,15 @@ async def edit_profile(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data.startswith("nav_"))
 async def navigate_profiles(callback: CallbackQuery, state: FSMContext):
     action, index = callback.data.split("_")[1], int(callback.data.split("_")[2])
-    new_index = index - 1 if action == "prev" else index + 1
-    await state.update_data(search_index=new_index)
-    await show_user_profile(callback, state, new_index)
+    if "search_mask" not in await state.get_data():
+        # Состояние поиска удалено хранилищем после простоя (см. SEARCH_STATE_PREFIXES).
+        await callback.answer("⌛ Поиск устарел, запустите /search заново", show_alert=True)
+        await callback.message.edit_reply_markup(reply_markup=None)
+        return
+    if action == "prev":
+        await show_user_profile(callback, state, index - 1, step=-1)
+    else:
+        await show_user_profile(callback, state, index + 1)
 
 @router.callback_query(F.data.startswith("tag_"))
 async def handle_tag_selection(callback: CallbackQuery, state: FSMContext):
@@ -220,13 +347,12 @@ async def handle_tag_selection(callback: CallbackQuery, state: FSMContext):
     await state.update_data(selected_tags=list(selected))
 
     current_state = await state.get_state()
-    is_find = current_state == FindUsers.awaiting_tags.state
-    confirm_text = "🔎 Найти" if is_find else "✅ Подтвердить"
-    confirm_cb = "find_confirm" if is_find else "tags_confirm"
+    if current_state == FindUsers.awaiting_tags.state:
+        keyboard = _find_tags_keyboard(selected)
+    else:
+        keyboard = get_tags_keyboard(list(selected))
 
-    await callback.message.edit_reply_markup(
-        reply_markup=get_tags_keyboard(list(selected), confirm_text=confirm_text, confirm_callback=confirm_cb)
-    )
+    await callback.message.edit_reply_markup(reply_markup=keyboard)
 
 @router.callback_query(F.data == "tags_confirm")
 async def confirm_tags(callback: CallbackQuery, state: FSMContext):
@@ -235,13 +361,12 @@ async def confirm_tags(callback: CallbackQuery, state: FSMContext):
     await state.update_data(tags=",".join(sorted(selected)))
 
     data_state = await state.get_data()
-    text = (
-        f"📌 Ваша анкета:\n"
-        f"👤 @{data_state['username']}\n"
-        f"📚 Курс: {data_state['course']}\n"
-        f"📝 Описание: {data_state.get('skills') or 'Не указано'}\n"
-        f"🛠 Навыки: {_format_tags(selected)}\n"
+    # Анкета ещё не сохранена: карточка строится без кэша.
+    preview = Profile(
+        callback.from_user.id, data_state["username"], data_state["course"], skills=data_state.get("skills"),
+        tag_mask=tags_to_mask(selected),
     )
+    text = ProfileCard(preview).own_text()
 
     if callback.message.photo:
         await callback.message.edit_caption(
@@ -261,21 +386,21 @@ async def confirm_tags(callback: CallbackQuery, state: FSMContext):
 async def find_confirm(callback: CallbackQuery, state: FSMContext):
     cur = await state.get_data()
     my_selected = set(cur.get("selected_tags", []))
+    find_text = cur.get("find_text")
 
-    if not my_selected:
+    if not my_selected and not find_text:
         await callback.answer("Выберите хотя бы один навык", show_alert=True)
         return
 
-    all_users = get_all_users(callback.from_user.id)
-
-    def overlap(u):
-        their = _parse_tags_str(u['tags'])
-        return len(my_selected & their)
-
-    users_filtered = [u for u in all_users if overlap(u) > 0]
-    users_sorted = sorted(users_filtered, key=lambda u: overlap(u), reverse=True)
-
-    if not users_sorted:
+    query_mask = tags_to_mask(my_selected)
+    if query_mask and not has_tag_matches(query_mask, callback.from_user.id):
+        # Ни у кого, кроме ищущего, нет выбранных навыков: выдача заведомо пуста.
+        found = 0
+    elif find_text:
+        found = await count_text_matches(find_text, query_mask, callback.from_user.id)
+    else:
+        found = count_ranked_users(query_mask, callback.from_user.id)
+    if not found:
         if callback.message.photo:
             await callback.message.edit_caption(
                 caption="Никого не найдено по выбранным навыкам. Попробуйте изменить набор навыков."
@@ -287,7 +412,7 @@ async def find_confirm(callback: CallbackQuery, state: FSMContext):
         await state.set_state(None)
         return
 
-    await state.update_data(search_users=users_sorted, search_index=0, my_tags=list(my_selected))
+    await _start_search(state, query_mask, callback.from_user.id, only_matching=True, text=find_text)
     await show_user_profile(callback, state, 0)
     await state.set_state(None)
 
@@ -311,6 +436,9 @@ async def handle_command_callback(callback: CallbackQuery, state: FSMContext):
             "/profile - Просмотреть или отредактировать анкету\n"
             "/search - Просмотреть анкеты других пользователей\n"
             "/find - Найти пользователей по навыкам\n"
+            "/find <текст> - Найти пользователей по описанию анкеты\n"
+            "/subscribe - Получать уведомления о новых анкетах с вашими навыками\n"
+            "/unsubscribe - Отключить уведомления\n"
             "/delete_profile - Удалить свою анкету\n"
             "/menu - Показать меню команд\n"
             "/help - Показать эту справку"
@@ -318,16 +446,10 @@ async def handle_command_callback(callback: CallbackQuery, state: FSMContext):
 
     elif command == "profile":
         user_id = callback.from_user.id
-        user_data = get_user(user_id)
+        user_data = await get_user(user_id)
         if user_data:
-            text = (
-                f"📌 Ваша анкета:\n"
-                f"👤 @{user_data['username']}\n"
-                f"📚 Курс: {user_data['course']}\n"
-                f"📝 Описание: {user_data['skills'] or 'Не указано'}\n"
-                f"🛠 Навыки: {_format_tags(_parse_tags_str(user_data['tags']))}\n"
-            )
-            if user_data.get('photo_id'):
+            text = profile_card(user_data).own_text()
+            if user_data.photo_id:
                 await msg.edit_caption(caption=text, reply_markup=get_confirm_keyboard())
             else:
                 await msg.edit_text(text, reply_markup=get_confirm_keyboard())
@@ -336,26 +458,21 @@ async def handle_command_callback(callback: CallbackQuery, state: FSMContext):
 
     elif command == "delete_profile":
         user_id = callback.from_user.id
-        delete_user(user_id)
+        await delete_user(user_id)
         await msg.edit_text("Ваша анкета удалена.")
 
     elif command == "search":
         user_id = callback.from_user.id
-        me = get_user(user_id)
-        my_tags = _parse_tags_str(me['tags'] if me else None)
-        users = get_all_users(user_id)
-        if not users:
-            await msg.edit_text("Анкеты закончились. Попробуйте позже!")
-            return
-        users_sorted = sorted(users, key=lambda u: len(my_tags & _parse_tags_str(u['tags'])), reverse=True)
-        await state.update_data(search_users=users_sorted, search_index=0, my_tags=list(my_tags))
+        me = await get_user(user_id)
+        my_mask = me.tag_mask if me else 0
+        await _start_search(state, my_mask, user_id, only_matching=False, recommended=True)
         await show_user_profile(callback, state, 0)
 
     elif command == "find":
-        await state.update_data(selected_tags=[])
+        await state.update_data(selected_tags=[], find_text=None)
         await msg.edit_text(
             "🧭 Выберите навыки для поиска:",
-            reply_markup=get_tags_keyboard([], confirm_text="🔎 Найти", confirm_callback="find_confirm")
+            reply_markup=_find_tags_keyboard([])
         )
         await state.set_state(FindUsers.awaiting_tags)
 
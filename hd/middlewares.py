@@ -0,0 +1,79 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """Ограничивает число одновременно обрабатываемых апдейтов.
+
+    Апдейты сверх лимита ждут своей очереди, не занимая обработчики; время
+    ожидания попадает в metrics.update_queue_duration, если metrics переданы.
+    """
+
+    def __init__(self, limit: int, metrics=None):
+        self.limit = limit
+        self.metrics = metrics
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        async with self._semaphore:
+            if self.metrics is not None:
+                self.metrics.update_queue_duration.observe(time.perf_counter() - started)
+            return await handler(event, data)
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware апдейтов: число апдейтов в обработке и полное время обработки."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        self.metrics.updates_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.metrics.updates_in_flight.dec()
+            self.metrics.update_duration.observe(
+                time.perf_counter() - started, type=getattr(event, "event_type", "unknown")
+            )
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Время выполнения и ошибки по каждому обработчику роутера.
+
+    Регистрируется как внутренний middleware: имя обработчика известно
+    только после того, как фильтры выбрали его.
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.metrics.handler_errors.inc(handler=name)
+            raise
+        finally:
+            self.metrics.handler_duration.observe(time.perf_counter() - started, handler=name)
@@ -1,81 +1,124 @@
 ﻿from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from typing import Union, List
+from functools import lru_cache
+from typing import Union, List, Optional, Tuple
 
 TAGS = [
     "web", "ux/ui", "management", "backend", "frontend", "ml", "data", "cloud",
     "android", "ios", "gamedev", "devops", "security", "python",
     "js", "c++", "c#", "java"
 ]
+_TAG_BITS = {tag: 1 << i for i, tag in enumerate(TAGS)}
+
+# Клавиатуры ниже создаются один раз и переиспользуются между вызовами,
+# поэтому возвращаемые объекты нельзя изменять на месте.
+TAGS_KEYBOARD_CACHE_SIZE = 1024
+NAVIGATION_KEYBOARD_CACHE_SIZE = 4096
+
+_COURSE_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="1 курс", callback_data="course_1"),
+        InlineKeyboardButton(text="2 курс", callback_data="course_2"),
+    ],
+    [
+        InlineKeyboardButton(text="3 курс", callback_data="course_3"),
+        InlineKeyboardButton(text="4 курс", callback_data="course_4"),
+    ],
+    [
+        InlineKeyboardButton(text="Магистратура", callback_data="course_master"),
+        InlineKeyboardButton(text="Аспирантура", callback_data="course_phd"),
+    ],
+])
+
+_CONFIRM_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_profile"),
+        InlineKeyboardButton(text="✏ Редактировать", callback_data="edit_profile"),
+    ]
+])
+
+_COMMANDS = [
+    ("🚀 Начать (/start)", "command_start"),
+    ("👤 Моя анкета (/profile)", "command_profile"),
+    ("🔎 Поиск (/search)", "command_search"),
+    ("🧭 Найти по навыкам (/find)", "command_find"),
+    ("🗑 Удалить анкету (/delete_profile)", "command_delete_profile"),
+    ("📚 Справка (/help)", "command_help"),
+]
+_COMMANDS_MENU_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text=text, callback_data=callback)] for text, callback in _COMMANDS
+])
 
 def get_course_keyboard():
     """Клавиатура для выбора курса."""
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="1 курс", callback_data="course_1"),
-            InlineKeyboardButton(text="2 курс", callback_data="course_2"),
-        ],
-        [
-            InlineKeyboardButton(text="3 курс", callback_data="course_3"),
-            InlineKeyboardButton(text="4 курс", callback_data="course_4"),
-        ],
-        [
-            InlineKeyboardButton(text="Магистратура", callback_data="course_master"),
-            InlineKeyboardButton(text="Аспирантура", callback_data="course_phd"),
-        ],
-    ])
-    return keyboard
+    return _COURSE_KEYBOARD
 
 def get_confirm_keyboard():
     """Клавиатура для подтверждения анкеты."""
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_profile"),
-            InlineKeyboardButton(text="✏ Редактировать", callback_data="edit_profile"),
-        ]
-    ])
-    return keyboard
-
-def get_navigation_keyboard(current_index, total):
-    """Клавиатура для навигации по анкетам."""
+    return _CONFIRM_KEYBOARD
+
+@lru_cache(maxsize=NAVIGATION_KEYBOARD_CACHE_SIZE)
+def _build_navigation_keyboard(current_index: int, has_prev: bool, has_next: bool):
     keyboard = []
-    if current_index > 0:
+    if has_prev:
         keyboard.append(InlineKeyboardButton(text="⬅ Назад", callback_data=f"nav_prev_{current_index}"))
-    if current_index < total - 1:
+    if has_next:
         keyboard.append(InlineKeyboardButton(text="Вперед ➡", callback_data=f"nav_next_{current_index}"))
     return InlineKeyboardMarkup(inline_keyboard=[keyboard]) if keyboard else None
 
+def get_navigation_keyboard(current_index, total, first_index=0):
+    """Клавиатура для навигации по анкетам; назад можно листать до first_index."""
+    return _build_navigation_keyboard(current_index, current_index > first_index, current_index < total - 1)
+
+# Кнопка тега кэшируется отдельно: сохранение анкеты меняет счётчики лишь
+# нескольких тегов, и остальные кнопки клавиатуры /find строятся заново
+# только при смене выбора.
+@lru_cache(maxsize=TAGS_KEYBOARD_CACHE_SIZE * 4)
+def _tag_button(tag: str, active: bool, count: Optional[int] = None) -> InlineKeyboardButton:
+    text = f"{'✅ ' if active else ''}{tag}"
+    if count is not None:
+        text += f" ({count})"
+    return InlineKeyboardButton(text=text, callback_data=f"tag_{tag}")
+
+@lru_cache(maxsize=TAGS_KEYBOARD_CACHE_SIZE)
+def _confirm_button(confirm_text: str, confirm_callback: str) -> InlineKeyboardButton:
+    return InlineKeyboardButton(text=confirm_text, callback_data=confirm_callback)
+
+def _layout_tags_keyboard(
+    selected_mask: int,
+    confirm_text: str,
+    confirm_callback: str,
+    counts: Optional[Tuple[int, ...]] = None,
+) -> InlineKeyboardMarkup:
+    buttons = [
+        _tag_button(tag, bool(selected_mask & _TAG_BITS[tag]), None if counts is None else counts[i])
+        for i, tag in enumerate(TAGS)
+    ]
+    rows = [buttons[i:i + 3] for i in range(0, len(buttons), 3)]
+    rows.append([_confirm_button(confirm_text, confirm_callback)])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+# Без счётчиков клавиатура зависит только от выбора и кэшируется целиком;
+# со счётчиками она собирается из кэшированных кнопок при каждом показе.
+_build_tags_keyboard = lru_cache(maxsize=TAGS_KEYBOARD_CACHE_SIZE)(_layout_tags_keyboard)
+
 def get_tags_keyboard(
     selected: Union[List[str], None] = None,
     confirm_text: str = "✅ Подтвердить",
-    confirm_callback: str = "tags_confirm"
+    confirm_callback: str = "tags_confirm",
+    counts: Optional[Tuple[int, ...]] = None,
 ) -> InlineKeyboardMarkup:
-    """Клавиатура для выбора тегов с возможностью переключения."""
-    selected = set(selected or [])
-    rows = []
-    row = []
-    for i, tag in enumerate(TAGS, start=1):
-        active = tag in selected
-        text = f"{'✅ ' if active else ''}{tag}"
-        row.append(InlineKeyboardButton(text=text, callback_data=f"tag_{tag}"))
-        if i % 3 == 0:
-            rows.append(row)
-            row = []
-    if row:
-        rows.append(row)
-    rows.append([InlineKeyboardButton(text=confirm_text, callback_data=confirm_callback)])
-    return InlineKeyboardMarkup(inline_keyboard=rows)
+    """Клавиатура для выбора тегов с возможностью переключения.
+
+    counts — число анкет с каждым тегом в порядке TAGS; если передано,
+    подписи кнопок выглядят как «python (412)».
+    """
+    selected_mask = 0
+    for tag in selected or []:
+        selected_mask |= _TAG_BITS.get(tag, 0)
+    if counts is None:
+        return _build_tags_keyboard(selected_mask, confirm_text, confirm_callback)
+    return _layout_tags_keyboard(selected_mask, confirm_text, confirm_callback, counts)
 
 def get_commands_menu_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура со списком команд."""
-    commands = [
-        ("🚀 Начать (/start)", "command_start"),
-        ("👤 Моя анкета (/profile)", "command_profile"),
-        ("🔎 Поиск (/search)", "command_search"),
-        ("🧭 Найти по навыкам (/find)", "command_find"),
-        ("🗑 Удалить анкету (/delete_profile)", "command_delete_profile"),
-        ("📚 Справка (/help)", "command_help"),
-    ]
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=text, callback_data=callback)] for text, callback in commands
-    ])
-    return keyboard
\ No newline at end of file
+    return _COMMANDS_MENU_KEYBOARD
\ No newline at end of file